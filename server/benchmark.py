@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import math
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+from time import time
+import numpy as np
+
+# Scaling benchmark of the compute entry points on synthetic screens. Run from the server directory:
+#
+#   python benchmark.py --sizes 100000 1000000 10000000 100000000 --output benchmark.json
+#
+# Every size is generated once as data set Benchmark<size> (see wrangle/synthetic.py). Entry points are then timed
+# in a fresh process without derived data on disk (cold), again in that process (warm), and in another fresh
+# process that reuses the derived data on disk (restart). Entry points run in order, so later ones share the
+# results of earlier ones, such as the predicted populations, like they do in an interactive session.
+
+dataPath = '../dataset/'
+wellColumns = 24
+wellRows = 16
+objectsPerWell = 1000
+featureCount = 20
+selectedFeatures = 8
+exemplarCount = 20
+featureBins = 90
+objectBins = 64
+
+def dataSetName(size):
+    return 'Benchmark' + str(size)
+
+# Generate the synthetic screen of the given size, unless it exists.
+def prepare(size):
+    from wrangle.synthetic import generate
+
+    path = os.path.join(dataPath, dataSetName(size))
+    if not os.path.isfile(os.path.join(path, 'config.py')):
+        plates = max(1, int(math.ceil(float(size) / (wellColumns * wellRows * objectsPerWell))))
+        generate(path, plates, wellColumns, wellRows, float(size) / (plates * wellColumns * wellRows), featureCount)
+    return path
+
+# Compute entry points of a data set, as (name, function) pairs.
+def entryPoints(dataSet):
+    import compute
+
+    objectCount = len(compute.data.numpyDump(dataSet, 'plate'))
+    random = np.random.RandomState(0)
+    features = frozenset(compute.data.imageFeatures(dataSet)[:selectedFeatures])
+    exemplars = frozenset([(popId, frozenset(random.randint(0, objectCount, size=exemplarCount).tolist()))
+                           for popId in [100, 101]])
+    probes = frozenset([('mds0', 0.5), ('mds1', 0.5)])
+
+    return [
+        ('featureMetrics', lambda: compute.featureMetrics(dataSet)),
+        ('clusters', lambda: compute.clusters(dataSet, features, exemplars)),
+        ('featureHistograms', lambda: compute.featureHistograms(dataSet, features, exemplars, featureBins)),
+        ('objectHistogramMatrix', lambda: compute.objectHistogramMatrix(dataSet, features, exemplars, objectBins)),
+        ('wellClusterShares', lambda: compute.wellClusterSharesFlat(dataSet, features, exemplars)),
+        ('objectInfo', lambda: compute.objectInfo(dataSet, features, 0, 0, 0, exemplars, probes)),
+        ('featureOrdering', lambda: compute.featureOrdering(dataSet))
+    ]
+
+# Time all entry points of a data set in this process, for the given cache states.
+def timeEntryPoints(dataSet, states):
+    entries = entryPoints(dataSet)
+    timings = []
+    for state in states:
+        for name, function in entries:
+            start = time()
+            function()
+            timings.append({'state': state, 'entry': name, 'seconds': time() - start})
+    return {'timings': timings, 'peakResidentBytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+# Time a data set in a fresh process.
+def timeInProcess(dataSet, states):
+    with tempfile.NamedTemporaryFile(suffix='.json') as output:
+        subprocess.check_call([sys.executable, __file__, '--child', dataSet, '--states'] + states +
+                              ['--output', output.name])
+        return json.load(open(output.name))
+
+def benchmark(sizes):
+    results = []
+    for size in sizes:
+        path = prepare(size)
+        dataSet = dataSetName(size)
+        objectCount = len(np.load(os.path.join(path, 'columns', 'plate.npy'), mmap_mode='r'))
+
+        shutil.rmtree(os.path.join(path, 'cache'), ignore_errors=True)
+        for states in [['cold', 'warm'], ['restart']]:
+            print "Benchmark " + dataSet + " " + "/".join(states)
+            run = timeInProcess(dataSet, states)
+            for timing in run['timings']:
+                timing.update({'dataSet': dataSet, 'objects': objectCount, 'peakResidentBytes': run['peakResidentBytes']})
+                results.append(timing)
+    return results
+
+def environment():
+    import multiprocessing
+    import pandas
+    import sklearn
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(), 'numpy': np.__version__, 'pandas': pandas.__version__,
+            'sklearn': sklearn.__version__}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark compute entry points on synthetic screens.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**5, 10**6, 10**7, 10**8],
+                        help="numbers of objects")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--states', nargs='+', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.child:
+        result = timeEntryPoints(arguments.child, arguments.states)
+    else:
+        result = {'environment': environment(), 'results': benchmark(arguments.sizes)}
+
+    with open(arguments.output, 'w') as output:
+        json.dump(result, output, indent=1)
@@ -0,0 +1,107 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from threading import RLock
+import numpyData
+
+# Block store backend: all columns of a data set are packed into a single memory-mapped block file, with a manifest
+# of column offsets, dtypes, and row counts. The block is packed from the NumPy columns on first use (per column
+# stamp) and opened once per process, after which columns are handed out as zero-copy views.
+
+# Shared with the NumPy column backend.
+from numpyData import systemObjectColumns, mdsColumns, dataPath, dataSetPaths, numpyPaths, wellPaths, \
+    config, stamp, cachePath, removeStaleCaches, wellAnnotations, sampleIndices
+
+blockFile = 'columns.block'
+manifestFile = 'columns.json'
+blockAlignment = 64         # Byte alignment of columns in the block.
+packChunkSize = 2**22       # Number of values to copy at a time when packing.
+
+# Opened block stores, by data set.
+stores = {}
+storeLock = RLock()
+
+def align(offset):
+    return -(-offset // blockAlignment) * blockAlignment
+
+# Pack the NumPy columns of a data set into a block file and write its manifest.
+def pack(dataSet):
+    blockPath = cachePath(dataSet, blockFile)
+    manifestPath = cachePath(dataSet, manifestFile)
+
+    print "Pack columns of " + dataSet
+    columns = {}
+    offset = 0
+    with open(blockPath + '.part', 'wb') as block:
+        for column in numpyData.objectColumns(dataSet):
+            values = numpyData.numpyDump(dataSet, column)
+            offset = align(offset)
+            block.seek(offset)
+            for start in range(0, len(values), packChunkSize):
+                block.write(np.ascontiguousarray(values[start:start + packChunkSize]).tostring())
+            columns[column] = {'offset': offset, 'dtype': values.dtype.str, 'rows': len(values)}
+            offset += values.nbytes
+        block.truncate(max(align(offset), blockAlignment))
+    os.rename(blockPath + '.part', blockPath)
+
+    # The manifest is written last; its presence marks a complete block.
+    with open(manifestPath + '.part', 'w') as manifest:
+        json.dump({'stamp': stamp(dataSet), 'columns': columns}, manifest)
+    os.rename(manifestPath + '.part', manifestPath)
+
+    # The packed block supersedes the derived data of earlier columns.
+    removeStaleCaches(dataSet)
+
+# Block memory map and manifest of a data set, packed if absent.
+def store(dataSet):
+    if dataSet not in stores:
+        with storeLock:
+            if dataSet not in stores:
+                manifestPath = cachePath(dataSet, manifestFile)
+                if not os.path.isfile(manifestPath):
+                    pack(dataSet)
+                with open(manifestPath) as manifest:
+                    columns = json.load(manifest)['columns']
+                block = np.memmap(cachePath(dataSet, blockFile), dtype=np.uint8, mode='r')
+                stores[dataSet] = (block, columns)
+    return stores[dataSet]
+
+def objectColumns(dataSet):
+    return [str(column) for column in store(dataSet)[1].keys()]
+
+def mdsColumnsPresent(dataSet):
+    columns = store(dataSet)[1]
+    return all([mdsCol in columns for mdsCol in mdsColumns])
+
+# The image feature columns that are available for every object.
+def imageFeatures(dataSet):
+    return sorted(list((set(objectColumns(dataSet)) - set(systemObjectColumns)) - set(mdsColumns)))
+
+# Feature columns, that include MDS columns when available.
+def features(dataSet):
+    ftrs = imageFeatures(dataSet)
+    if mdsColumnsPresent(dataSet):
+        ftrs += mdsColumns
+    return ftrs
+
+# Zero-copy, read-only view of a column in the block.
+def numpyDump(dataSet, column):
+    block, columns = store(dataSet)
+    spec = columns[column]
+    return np.ndarray(shape=(spec['rows'],), dtype=np.dtype(str(spec['dtype'])), buffer=block, offset=spec['offset'])
+
+# Combine multiple columns into a data frame indexed by object id.
+def columnsDump(dataSet, columns):
+    return pd.DataFrame({col: numpyDump(dataSet, col) for col in columns})
+
+# Number of objects, from the manifest.
+def objectCount(dataSet):
+    return store(dataSet)[1]['plate']['rows']
+
+# Columns of given objects, in a data frame indexed by object id.
+def objectRows(dataSet, objects):
+    return pd.DataFrame({col: numpyDump(dataSet, col)[objects] for col in objectColumns(dataSet)}, index=objects)
+
+def objectSample(dataSet, size, seed=0):
+    return objectRows(dataSet, sampleIndices(objectCount(dataSet), size, seed))
@@ -1,6 +1,12 @@
-from collections import namedtuple
+import sys
+import mmap
+import numpy as np
+import pandas as pd
+from bisect import bisect_left
+from time import time as _time
+from collections import namedtuple, defaultdict
 from functools import update_wrapper
-from threading import RLock
+from threading import Lock, RLock, Event
 
 _CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
 
@@ -14,6 +20,197 @@ class _HashedSeq(list):
     def __hash__(self):
         return self.hashvalue
 
+_LATENCY_BOUNDS = (0.001, 0.01, 0.1, 1.0, 10.0, 100.0)     # upper bounds of latency buckets, in seconds
+
+class _Timings(object):
+    'Count and latency histogram of calls, with a bucket per latency bound and one beyond the last bound'
+
+    def __init__(self):
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.counts = [0] * (len(_LATENCY_BOUNDS) + 1)
+            self.seconds = 0.0
+            self.slowest = 0.0
+
+    def record(self, seconds):
+        with self.lock:
+            self.counts[bisect_left(_LATENCY_BOUNDS, seconds)] += 1
+            self.seconds += seconds
+            self.slowest = max(self.slowest, seconds)
+
+    def report(self):
+        with self.lock:
+            return {'count': sum(self.counts),
+                    'seconds': self.seconds,
+                    'slowest': self.slowest,
+                    'histogram': [[bound, count] for bound, count in zip(_LATENCY_BOUNDS + (None,), self.counts)]}
+
+class _Flight(object):
+    'Computation of a key that is in progress, shared by all callers of that key'
+    __slots__ = 'done', 'result', 'error'
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+    def outcome(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.result
+
+def sizeof(value, _seen=None):
+    'Estimate the bytes held in memory by a value, where file-backed arrays are free'
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        base = value
+        while base is not None:
+            if isinstance(base, (np.memmap, mmap.mmap)):
+                return 0
+            base = getattr(base, 'base', None)
+        size = value.nbytes
+        if value.dtype.hasobject and value.size > 0:
+            # extrapolate the size of referenced objects from a sample
+            sample = value.ravel()[:1000]
+            size += sum(sys.getsizeof(element) for element in sample) * value.size // len(sample)
+        return size
+    elif isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    elif isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    elif isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k, _seen) + sizeof(v, _seen) for k, v in value.iteritems())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(sizeof(element, _seen) for element in value)
+    else:
+        return sys.getsizeof(value)
+
+class _Budget(object):
+    """Memory budget that is shared by the entries of weighted caches.
+
+    Entries are evicted by GreedyDual-Size priority: the cost of recomputing an
+    entry per byte that it holds, aged by an inflation clock that advances to
+    the priority of every evicted entry. An entry is refreshed when it is used.
+
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.held = 0
+        self.clock = 0.0
+        self.entries = dict()   # (discard, key) to [size, cost, priority, value]
+        self.lock = RLock()
+
+    def held_by(self):
+        'Bytes held per discard function'
+        with self.lock:
+            held = defaultdict(int)
+            for (discard, key), entry in self.entries.iteritems():
+                held[discard] += entry[0]
+            return held
+
+    def admit(self, discard, key, value, size, cost):
+        'Register an entry and return the (discard, key, value) victims to evict for it'
+        with self.lock:
+            self.forget(discard, key)
+            self.entries[(discard, key)] = [size, cost, self.clock + float(cost) / max(size, 1), value]
+            self.held += size
+            return self.shrink((discard, key))
+
+    def shrink(self, retained=None):
+        # called with the lock held; the retained entry is never evicted
+        victims = []
+        while self.held > self.limit:
+            candidates = [item for item in self.entries.iteritems() if item[0] != retained]
+            if not candidates:
+                break
+            owner, entry = min(candidates, key=lambda item: item[1][2])
+            del self.entries[owner]
+            self.held -= entry[0]
+            self.clock = entry[2]
+            victims.append(owner + (entry[3],))
+        return victims
+
+    def touch(self, discard, key):
+        with self.lock:
+            entry = self.entries.get((discard, key))
+            if entry is not None:
+                entry[2] = self.clock + float(entry[1]) / max(entry[0], 1)
+
+    def forget(self, discard, key):
+        with self.lock:
+            entry = self.entries.pop((discard, key), None)
+            if entry is not None:
+                self.held -= entry[0]
+
+    def forget_all(self, discard):
+        with self.lock:
+            for owner in [owner for owner in self.entries if owner[0] is discard]:
+                self.forget(*owner)
+
+def _evict(victims):
+    for discard, key, value in victims:
+        discard(key, value)
+
+_budget = _Budget(4 * 1024**3)
+_caches = []        # (name, cache function, discard function) of every lru_cache decorated function
+_owners = dict()    # discard function to name of other caches that were registered with admit
+
+def memory_budget(limit=None):
+    'Set the bytes shared by weighted caches when a limit is given, and return the limit'
+    if limit is not None:
+        with _budget.lock:
+            _budget.limit = limit
+            victims = _budget.shrink()
+        _evict(victims)
+    return _budget.limit
+
+def memory_held():
+    'Bytes that are held by weighted caches'
+    return _budget.held
+
+def admit(discard, key, value, cost, size=None):
+    """Register a value of another cache under the memory budget.
+
+    The cache is reported by the module of *discard* in cache_stats.
+
+    The value costs *cost* to recompute, and *discard(key, value)* is called
+    when it is evicted. Its size is estimated by sizeof if not given.
+
+    """
+    _owners.setdefault(discard, discard.__module__)
+    _evict(_budget.admit(discard, key, value, sizeof(value) if size is None else size, cost))
+
+def touch(discard, key):
+    'Record a use of a value that was registered with admit'
+    _budget.touch(discard, key)
+
+def forget(discard, key):
+    'Unregister a value that was registered with admit'
+    _budget.forget(discard, key)
+
+def cache_stats():
+    """Report every cache: the cache info, call and computation timings, and bytes
+    held under the memory budget of lru_cache decorated functions, and the bytes
+    held by other caches that were registered with admit.
+
+    """
+    held = _budget.held_by()
+    stats = [dict(f.cache_info()._asdict(), name=name, weighted=f.weighted,
+                  bytes=held.get(discard, 0), calls=f.call_timings(), computations=f.computation_timings())
+             for name, f, discard in _caches]
+    stats += [{'name': name, 'weighted': True, 'bytes': held.get(discard, 0)} for discard, name in _owners.items()]
+    return stats
+
 def _make_key(args, kwds, typed,
              kwd_mark = (object(),),
              fasttypes = {int, str, frozenset, type(None)},
@@ -33,7 +230,7 @@ def _make_key(args, kwds, typed,
         return key[0]
     return _HashedSeq(key)
 
-def lru_cache(maxsize=100, typed=False):
+def lru_cache(maxsize=100, typed=False, weight=None):
     """Least-recently-used cache decorator.
 
     If *maxsize* is set to None, the LRU features are disabled and the cache
@@ -45,10 +242,22 @@ def lru_cache(maxsize=100, typed=False):
 
     Arguments to the cached function must be hashable.
 
+    Concurrent calls with the same arguments are computed once: callers that
+    miss while that computation is in flight wait for it, and share its result
+    or exception. Calls with different arguments run in parallel.
+
+    If *weight* is set, results are also held under the memory budget that is
+    shared by all weighted caches (see memory_budget). A result is evicted by
+    the time it took to compute it, multiplied by weight, per byte it holds.
+
     View the cache statistics named tuple (hits, misses, maxsize, currsize) with
     f.cache_info().  Clear the cache and statistics with f.cache_clear().
     Access the underlying function with f.__wrapped__.
 
+    View the count and latency histogram of calls with f.call_timings(), and of
+    computations on cache misses with f.computation_timings().  All caches are
+    reported by cache_stats().
+
     See:  http://en.wikipedia.org/wiki/Cache_algorithms#Least_Recently_Used
 
     """
@@ -61,7 +270,10 @@ def lru_cache(maxsize=100, typed=False):
     def decorating_function(user_function):
 
         cache = dict()
+        flights = dict()                # keys that are being computed, to their flights
         stats = [0, 0]                  # make statistics updateable non-locally
+        calls = _Timings()              # latency of calls
+        computations = _Timings()       # latency of user function calls on misses
         HITS, MISSES = 0, 1             # names for the stats fields
         make_key = _make_key
         cache_get = cache.get           # bound method to lookup key or return None
@@ -71,77 +283,151 @@ def lru_cache(maxsize=100, typed=False):
         root[:] = [root, root, None, None]      # initialize by pointing to self
         nonlocal_root = [root]                  # make updateable non-locally
         PREV, NEXT, KEY, RESULT = 0, 1, 2, 3    # names for the link fields
+        missing = object()                      # unique not-found sentinel of lookups
+
+        def discard(key, result):
+            # remove an entry that was evicted from the memory budget, if it
+            # still holds the evicted result
+            with lock:
+                if maxsize is None:
+                    if cache_get(key, root) is result:
+                        del cache[key]
+                else:
+                    link = cache_get(key)
+                    if link is not None and link[RESULT] is result:
+                        link_prev, link_next = link[PREV], link[NEXT]
+                        link_prev[NEXT] = link_next
+                        link_next[PREV] = link_prev
+                        del cache[key]
+
+        def compute(key, args, kwds, lookup, store):
+            # return the result if it was stored since the caller missed, join
+            # the flight of the key if one is in progress, or compute it in a
+            # new flight and store the result while the lock is held
+            with lock:
+                result = lookup(key)
+                if result is not missing:
+                    return result
+                flight = flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = flights[key] = _Flight()
+                else:
+                    stats[HITS] += 1
+            if not leader:
+                return flight.outcome()
+            try:
+                start = _time()
+                result = user_function(*args, **kwds)
+                elapsed = _time() - start
+                computations.record(elapsed)
+                cost = elapsed * weight if weight is not None else 0
+                size = sizeof(result) if weight is not None else 0
+            except:
+                flight.error = sys.exc_info()
+                with lock:
+                    del flights[key]
+                flight.done.set()
+                raise
+            victims = ()
+            with lock:
+                store(key, result)
+                if weight is not None:
+                    victims = _budget.admit(discard, key, result, size, cost)
+                stats[MISSES] += 1
+                flight.result = result
+                del flights[key]
+            flight.done.set()
+            _evict(victims)
+            return result
 
         if maxsize == 0:
 
             def wrapper(*args, **kwds):
                 # no caching, just do a statistics update after a successful call
+                start = _time()
                 result = user_function(*args, **kwds)
+                computations.record(_time() - start)
                 stats[MISSES] += 1
                 return result
 
         elif maxsize is None:
 
+            def lookup(key):
+                result = cache_get(key, missing)
+                if result is not missing:
+                    stats[HITS] += 1
+                    if weight is not None:
+                        _budget.touch(discard, key)
+                return result
+
             def wrapper(*args, **kwds):
                 # simple caching without ordering or size limit
                 key = make_key(args, kwds, typed)
-                result = cache_get(key, root)   # root used here as a unique not-found sentinel
-                if result is not root:
-                    stats[HITS] += 1
+                result = lookup(key)
+                if result is not missing:
                     return result
-                result = user_function(*args, **kwds)
-                cache[key] = result
-                stats[MISSES] += 1
-                return result
+                return compute(key, args, kwds, lookup, cache.__setitem__)
 
         else:
 
+            def lookup(key):
+                # called with the lock held
+                link = cache_get(key)
+                if link is None:
+                    return missing
+                # record recent use of the key by moving it to the front of the list
+                root, = nonlocal_root
+                link_prev, link_next, key, result = link
+                link_prev[NEXT] = link_next
+                link_next[PREV] = link_prev
+                last = root[PREV]
+                last[NEXT] = root[PREV] = link
+                link[PREV] = last
+                link[NEXT] = root
+                stats[HITS] += 1
+                if weight is not None:
+                    _budget.touch(discard, key)
+                return result
+
             def wrapper(*args, **kwds):
                 # size limited caching that tracks accesses by recency
                 key = make_key(args, kwds, typed) if kwds or typed else args
                 with lock:
-                    link = cache_get(key)
-                    if link is not None:
-                        # record recent use of the key by moving it to the front of the list
-                        root, = nonlocal_root
-                        link_prev, link_next, key, result = link
-                        link_prev[NEXT] = link_next
-                        link_next[PREV] = link_prev
-                        last = root[PREV]
-                        last[NEXT] = root[PREV] = link
-                        link[PREV] = last
-                        link[NEXT] = root
-                        stats[HITS] += 1
-                        return result
-                result = user_function(*args, **kwds)
-                with lock:
-                    root, = nonlocal_root
-                    if key in cache:
-                        # getting here means that this same key was added to the
-                        # cache while the lock was released.  since the link
-                        # update is already done, we need only return the
-                        # computed result and update the count of misses.
-                        pass
-                    elif _len(cache) >= maxsize:
-                        # use the old root to store the new key and result
-                        oldroot = root
-                        oldroot[KEY] = key
-                        oldroot[RESULT] = result
-                        # empty the oldest link and make it the new root
-                        root = nonlocal_root[0] = oldroot[NEXT]
-                        oldkey = root[KEY]
-                        oldvalue = root[RESULT]
-                        root[KEY] = root[RESULT] = None
-                        # now update the cache dictionary for the new links
-                        del cache[oldkey]
-                        cache[key] = oldroot
-                    else:
-                        # put result in a new link at the front of the list
-                        last = root[PREV]
-                        link = [last, root, key, result]
-                        last[NEXT] = root[PREV] = cache[key] = link
-                    stats[MISSES] += 1
-                return result
+                    result = lookup(key)
+                if result is not missing:
+                    return result
+                return compute(key, args, kwds, lookup, store)
+
+            def store(key, result):
+                # called with the lock held
+                root, = nonlocal_root
+                if key in cache:
+                    # single-flight computation should prevent getting here, but
+                    # if this same key was added to the cache while the lock was
+                    # released, then the link update is already done, and we
+                    # need only return the computed result.
+                    pass
+                elif _len(cache) >= maxsize:
+                    # use the old root to store the new key and result
+                    oldroot = root
+                    oldroot[KEY] = key
+                    oldroot[RESULT] = result
+                    # empty the oldest link and make it the new root
+                    root = nonlocal_root[0] = oldroot[NEXT]
+                    oldkey = root[KEY]
+                    oldvalue = root[RESULT]
+                    root[KEY] = root[RESULT] = None
+                    # now update the cache dictionary for the new links
+                    del cache[oldkey]
+                    cache[key] = oldroot
+                    if weight is not None:
+                        _budget.forget(discard, oldkey)
+                else:
+                    # put result in a new link at the front of the list
+                    last = root[PREV]
+                    link = [last, root, key, result]
+                    last[NEXT] = root[PREV] = cache[key] = link
 
         def cache_info():
             """Report cache statistics"""
@@ -152,13 +438,30 @@ def lru_cache(maxsize=100, typed=False):
             """Clear the cache and cache statistics"""
             with lock:
                 cache.clear()
+                if weight is not None:
+                    _budget.forget_all(discard)
                 root = nonlocal_root[0]
                 root[:] = [root, root, None, None]
                 stats[:] = [0, 0]
+                calls.clear()
+                computations.clear()
+
+        cached = wrapper
+
+        def wrapper(*args, **kwds):
+            start = _time()
+            try:
+                return cached(*args, **kwds)
+            finally:
+                calls.record(_time() - start)
 
         wrapper.__wrapped__ = user_function
         wrapper.cache_info = cache_info
         wrapper.cache_clear = cache_clear
+        wrapper.call_timings = calls.report
+        wrapper.computation_timings = computations.report
+        wrapper.weighted = weight is not None
+        _caches.append((user_function.__module__ + '.' + user_function.__name__, wrapper, discard))
         return update_wrapper(wrapper, user_function)
 
     return decorating_function
@@ -1,15 +1,28 @@
+import os
+from time import time
 import numpy as np
 import pandas as pd
 import itertools
 import json
-import numpyData as data    # Swappable data backend.
-from wrapt import synchronized
+import blockData as data    # Swappable data backend.
 from sklearn.ensemble import RandomForestClassifier
 from scipy.ndimage.morphology import grey_erosion
 from multiprocessing.dummy import Pool  # Use multi-threading instead of multi-processing; synchronize functions!
-from cache import lru_cache
+from multiprocessing import Pool as ProcessPool     # For chunked passes over whole columns.
+from cache import lru_cache, memory_budget
+import modelStore
+import probeIndex
+import histograms
+import shardPool
 from collections import defaultdict
 
+# Bytes of cached results to keep in memory, shared by all cached functions and models.
+memory_budget(4 * 1024**3)
+
+# Weights of cached results in the shared memory budget, by the effort it takes to restore them.
+dataSetWeight = 10      # Per data set structures.
+requestWeight = 1       # Per request results.
+
 # Names of available data sets.
 def dataSets():
     return data.dataSetPaths.keys()
@@ -49,60 +62,198 @@ def columns(dataSet, columns):
     return data.columnsDump(dataSet, cols)
 
 # Retrieve well annotations.
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=5, weight=dataSetWeight)
 def wellAnnotations(dataSet):
     return data.wellAnnotations(dataSet)
 
 # Retrieve well types from well annotations.
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=5, weight=dataSetWeight)
 def wellTypes(dataSet):
     return list()   #list(set([an[0] for an in data.wellAnnotations(dataSet)['Type'].values()]))
 
 # Small sample for visualizations.
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=5, weight=dataSetWeight)
 def smallSample(dataSet):
-    return data.objectSample(dataSet, 10**3)
+    return data.objectRows(dataSet, objectSample(dataSet, 10**3, 'plate'))
+
+# Absolute well id of plate, column, and row coordinates.
+def wellId(dataSet, plate, column, row):
+    cfg = configuration(dataSet)
+    return (plate * len(cfg.columns) + column) * len(cfg.rows) + row
+
+# Number of absolute wells, over all plates.
+def wellCount(dataSet):
+    cfg = configuration(dataSet)
+    return len(cfg.plates) * len(cfg.columns) * len(cfg.rows)
 
-# Well coordinate information for all objects, includes well type if provided in annotations.
-@lru_cache(maxsize=5)
-def wellIndex(dataSet):
-    wellColumns = data.columnsDump(dataSet, data.systemObjectColumns)
+# Well type population id per absolute well, NaN for wells without a type annotation.
+@lru_cache(maxsize=5, weight=dataSetWeight)
+def wellTypeIndex(dataSet):
+    types = np.empty(wellCount(dataSet))
+    types.fill(np.nan)
 
     wTs = wellTypes(dataSet)
     if len(wTs) > 0:
         annotationMap = wellAnnotations(dataSet)['Type']
         typeToPopID = {tp: i + 3 for i, tp in enumerate(wTs)}   # Well type IDs start at 3, see src/model.ts -> Population
 
-        cfg = configuration('CellMorph')
-        columnCnt = len(cfg.columns)
-        rowCnt = len(cfg.rows)
-        def convertTag(wellTag):
+        for wellTag, wT in annotationMap.iteritems():
             plate, column, row = [int(part) for part in wellTag.split("_")]
-            return plate * columnCnt * rowCnt + column * rowCnt + row
-
-        annotationDict = {convertTag(tag): typeToPopID[wT[0]] for tag, wT in annotationMap.iteritems()}
-        annotationArr = np.array([annotationDict[i] for i in range(len(annotationDict))], np.int)
-
-        objectAbsWell = wellColumns['plate'] * columnCnt * rowCnt + wellColumns['column'] * rowCnt + wellColumns['row']
-        wellColumns['type'] = annotationArr[objectAbsWell.values]
+            types[wellId(dataSet, plate, column, row)] = typeToPopID[wT[0]]
+
+    return types
+
+# Well index files: absolute well id per object, object indices sorted by well, and per well offsets into the latter.
+wellIdsFile = 'wellIds.npy'
+wellOrderFile = 'wellOrder.npy'
+wellOffsetsFile = 'wellOffsets.npy'
+wellChunkSize = 2**22   # Number of objects to index at a time.
+
+def writeWellObjectIndex(dataSet):
+    plates, columns, rows = [data.numpyDump(dataSet, col) for col in ['plate', 'column', 'row']]
+    objectCount = len(plates)
+    wells = wellCount(dataSet)
+    idsPath = data.cachePath(dataSet, wellIdsFile)
+    orderPath = data.cachePath(dataSet, wellOrderFile)
+    offsetsPath = data.cachePath(dataSet, wellOffsetsFile)
+
+    print "Index wells of " + dataSet
+    wellIds = np.lib.format.open_memmap(idsPath + '.part', mode='w+', dtype=np.int32, shape=(objectCount,))
+    counts = np.zeros(wells, dtype=np.int64)
+    for start in range(0, objectCount, wellChunkSize):
+        chunk = slice(start, start + wellChunkSize)
+        ids = wellId(dataSet, plates[chunk].astype(np.int32), columns[chunk], rows[chunk])
+        wellIds[chunk] = ids
+        counts += np.bincount(ids, minlength=wells)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    # Counting sort of objects by well, which retains object order within a well.
+    order = np.lib.format.open_memmap(orderPath + '.part', mode='w+',
+                                      dtype=np.int32 if objectCount < 2**31 else np.int64, shape=(objectCount,))
+    cursor = offsets[:-1].copy()
+    for start in range(0, objectCount, wellChunkSize):
+        ids = np.asarray(wellIds[start:start + wellChunkSize])
+        chunkOrder = np.argsort(ids, kind='mergesort')
+        chunkCounts = np.bincount(ids, minlength=wells)
+        chunkStarts = np.cumsum(chunkCounts) - chunkCounts
+        sortedIds = ids[chunkOrder]
+        order[cursor[sortedIds] + np.arange(len(ids)) - chunkStarts[sortedIds]] = start + chunkOrder
+        cursor += chunkCounts
+
+    wellIds.flush()
+    order.flush()
+    del wellIds, order
+    with open(offsetsPath + '.part', 'wb') as file:
+        np.save(file, offsets)
+    os.rename(idsPath + '.part', idsPath)
+    os.rename(orderPath + '.part', orderPath)
+    os.rename(offsetsPath + '.part', offsetsPath)
+
+# Compressed well to object index, as memory-mapped well id per object, well-sorted objects, and well offsets.
+@lru_cache(maxsize=5, weight=dataSetWeight)
+def wellObjectIndex(dataSet):
+    offsetsPath = data.cachePath(dataSet, wellOffsetsFile)
+    if not os.path.isfile(offsetsPath):
+        writeWellObjectIndex(dataSet)
+
+    return np.load(data.cachePath(dataSet, wellIdsFile), mmap_mode='r'), \
+           np.load(data.cachePath(dataSet, wellOrderFile), mmap_mode='r'), \
+           np.load(offsetsPath)
+
+# Sorted indices of a seeded object sample, optionally stratified by 'plate' or 'well', persisted next to the data set.
+sampleFile = 'sample_%s_%d_%d.npy'
+
+@lru_cache(maxsize=5, weight=dataSetWeight)
+def objectSample(dataSet, size, strata=None, seed=0):
+    path = data.cachePath(dataSet, sampleFile % (strata or 'all', size, seed))
+    if os.path.isfile(path):
+        return np.load(path)
+
+    if strata is None:
+        objects = data.sampleIndices(data.objectCount(dataSet), size, seed)
     else:
-        wellColumns['type'] = np.nan
-
-    return wellColumns
-
-def ftrMet(dataSet, ftr):
-    col = data.numpyDump(dataSet, ftr)
-    return {metric: np.asscalar(getattr(np, metric)(col)) for metric in ['min', 'max', 'mean']}
-
-@synchronized
-@lru_cache(maxsize=5)
+        wellIds, order, offsets = wellObjectIndex(dataSet)
+        if strata == 'plate':
+            cfg = configuration(dataSet)
+            offsets = offsets[::len(cfg.columns) * len(cfg.rows)]
+        objects = np.sort(order[data.sampleIndices(len(order), size, seed, offsets)])
+
+    with open(path + '.part', 'wb') as file:
+        np.save(file, objects)
+    os.rename(path + '.part', path)
+
+    return objects
+
+# Plate shards of the well-sorted objects, for the shard pool.
+@lru_cache(maxsize=5, weight=dataSetWeight)
+def plateShards(dataSet):
+    wellIds, order, offsets = wellObjectIndex(dataSet)
+    cfg = configuration(dataSet)
+    return shardPool.plateShards(order.filename, offsets, len(cfg.columns) * len(cfg.rows))
+
+# Object indices of a well, as a slice of the well-sorted objects.
+def wellObjects(dataSet, plate, column, row):
+    wellIds, order, offsets = wellObjectIndex(dataSet)
+    well = wellId(dataSet, plate, column, row)
+    return order[offsets[well]:offsets[well + 1]] if 0 <= well < len(offsets) - 1 else order[:0]
+
+# Plate, column, and row coordinates of absolute well ids.
+def wellCoordinates(dataSet, wells):
+    cfg = configuration(dataSet)
+    return np.unravel_index(wells, (len(cfg.plates), len(cfg.columns), len(cfg.rows)))
+
+# Well type population ids of the given objects.
+def objectWellTypes(dataSet, objects):
+    wellIds, order, offsets = wellObjectIndex(dataSet)
+    return wellTypeIndex(dataSet)[wellIds[objects]]
+
+# Feature metrics are persisted next to the data set, stamped by its columns.
+metricsFile = 'featureMetrics.json'
+metricsChunkSize = 2**22    # Number of values to reduce at a time.
+
+# Minimum, maximum, and sum of a chunk of values. These merge to the same metrics for any chunking of a column,
+# also when it holds NaN values, which propagate.
+def chunkMetrics(chunk):
+    return np.min(chunk), np.max(chunk), np.sum(chunk, dtype=np.float64)
+
+def mergeMetrics(parts):
+    mins, maxs, sums = zip(*parts)
+    return np.min(mins), np.max(maxs), np.sum(sums)
+
+# Minimum, maximum, and mean of merged chunk metrics of count values.
+def metricsOf(parts, count):
+    colMin, colMax, colSum = mergeMetrics(parts)
+    return {'min': np.asscalar(colMin), 'max': np.asscalar(colMax), 'mean': np.asscalar(colSum) / count}
+
+# Minimum, maximum, and mean of a column, in a single chunked pass.
+def columnMetrics(col):
+    return metricsOf([chunkMetrics(col[start:start + metricsChunkSize])
+                      for start in range(0, len(col), metricsChunkSize)], len(col))
+
+def ftrMet(args):
+    (dataSet, ftr) = args
+    return ftr, columnMetrics(data.numpyDump(dataSet, ftr))
+
+@lru_cache(maxsize=5, weight=dataSetWeight)
 def featureMetrics(dataSet):
+    path = data.cachePath(dataSet, metricsFile)
+    if os.path.isfile(path):
+        with open(path) as file:
+            stored = json.load(file)
+        if stored['stamp'] == data.stamp(dataSet):
+            return stored['metrics']
+
     print "Computing image feature metrics for " + dataSet
-    return {feature: ftrMet(dataSet, feature) for feature in data.features(dataSet)}
+    pool = ProcessPool()
+    metrics = dict(pool.imap_unordered(ftrMet, [(dataSet, feature) for feature in data.features(dataSet)]))
+    pool.close()
+    pool.join()
+
+    with open(path + '.part', 'w') as file:
+        json.dump({'stamp': data.stamp(dataSet), 'metrics': metrics}, file)
+    os.rename(path + '.part', path)
 
-@lru_cache(maxsize=5)
-def wellToObjects(dataSet):
-    return wellIndex(dataSet).groupby(['plate', 'row', 'column']).groups
+    return metrics
 
 # Restrict sample features to those of images.
 def selectImageFeatures(dataSet, subset):
@@ -129,124 +280,279 @@ def scale(dataSet, subset):
 def scaledSmallSample(dataSet):
     return scale(selectImageFeatures(dataSet, smallSample))
 
-@synchronized
-@lru_cache(maxsize=5)
+# Scaled values of all features, persisted as float32 matrices in feature-major and object-major layout.
+scaledFeaturesFile = 'scaledFeatures.npy'
+scaledObjectsFile = 'scaledObjects.npy'
+scaleChunkSize = 2**20  # Number of objects to scale at a time.
+
+def writeScaledMatrices(dataSet):
+    ftrs = data.features(dataSet)
+    metrics = featureMetrics(dataSet)
+    objectCount = len(data.numpyDump(dataSet, 'plate'))
+    featurePath = data.cachePath(dataSet, scaledFeaturesFile)
+    objectPath = data.cachePath(dataSet, scaledObjectsFile)
+
+    print "Scale features of " + dataSet
+    featureMajor = np.lib.format.open_memmap(featurePath + '.part', mode='w+', dtype=np.float32,
+                                             shape=(len(ftrs), objectCount))
+    for i, ftr in enumerate(ftrs):
+        col = data.numpyDump(dataSet, ftr)
+        for start in range(0, objectCount, scaleChunkSize):
+            featureMajor[i, start:start + scaleChunkSize] = adaptiveScale(col[start:start + scaleChunkSize], metrics[ftr])
+    featureMajor.flush()
+
+    # Transpose chunk-wise to object-major layout.
+    objectMajor = np.lib.format.open_memmap(objectPath + '.part', mode='w+', dtype=np.float32,
+                                            shape=(objectCount, len(ftrs)))
+    for start in range(0, objectCount, scaleChunkSize):
+        objectMajor[start:start + scaleChunkSize] = featureMajor[:, start:start + scaleChunkSize].transpose()
+    objectMajor.flush()
+
+    del featureMajor, objectMajor
+    os.rename(objectPath + '.part', objectPath)
+    os.rename(featurePath + '.part', featurePath)
+
+    # The matrices of earlier columns are superseded.
+    data.removeStaleCaches(dataSet)
+
+# Feature to matrix index map, and memory-mapped feature-major and object-major scaled matrices.
+@lru_cache(maxsize=5, weight=dataSetWeight)
+def scaledMatrices(dataSet):
+    featurePath = data.cachePath(dataSet, scaledFeaturesFile)
+    objectPath = data.cachePath(dataSet, scaledObjectsFile)
+    if not (os.path.isfile(featurePath) and os.path.isfile(objectPath)):
+        writeScaledMatrices(dataSet)
+
+    index = {ftr: i for i, ftr in enumerate(data.features(dataSet))}
+    return index, np.load(featurePath, mmap_mode='r'), np.load(objectPath, mmap_mode='r')
+
 def scaledArray(dataSet, column):
-    return adaptiveScale(data.numpyDump(dataSet, column), featureMetrics(dataSet)[column])
+    index, featureMajor, objectMajor = scaledMatrices(dataSet)
+    return featureMajor[index[column]]
+
+# Object-major matrix of scaled values for given columns, of all objects or given objects.
+def scaledObjects(dataSet, columns, objects=None):
+    index, featureMajor, objectMajor = scaledMatrices(dataSet)
+    rows = objectMajor if objects is None else objectMajor[objects]
+    return np.take(rows, [index[c] for c in columns], axis=1)
 
 def scaledColumns(dataSet, columns):
-    return pd.DataFrame(index=wellIndex(dataSet).index, data={c: scaledArray(dataSet, c) for c in columns})
+    return pd.DataFrame(data={c: scaledArray(dataSet, c) for c in columns})
 
 def dataFrameToDict(frame):
     return {str(k): v for k, v in frame.to_dict().iteritems()}
 
-@lru_cache(maxsize=5)
+# Pearson correlation matrix of the image features over all objects, persisted next to the data set.
+correlationFile = 'featureCorrelation.npy'
+correlationChunkSize = 2**18    # Number of objects to accumulate at a time.
+
+# Object count, sums, and cross-product sums of a chunk of image features, shifted by their means for precision.
+# Objects with a missing value are left out.
+def correlationSums(args):
+    (dataSet, ftrs, means, start, end) = args
+    chunk = np.empty((end - start, len(ftrs)))
+    for i, ftr in enumerate(ftrs):
+        chunk[:, i] = data.numpyDump(dataSet, ftr)[start:end]
+    chunk -= means
+    chunk = chunk[np.all(np.isfinite(chunk), axis=1)]
+    return len(chunk), np.sum(chunk, axis=0), np.dot(chunk.T, chunk)
+
+@lru_cache(maxsize=5, weight=dataSetWeight)
+def featureCorrelation(dataSet):
+    path = data.cachePath(dataSet, correlationFile)
+    if os.path.isfile(path):
+        return np.load(path)
+
+    print "Correlate image features of " + dataSet
+    ftrs = data.imageFeatures(dataSet)
+    metrics = featureMetrics(dataSet)
+    means = np.array([metrics[ftr]['mean'] for ftr in ftrs])
+    objectCount = len(data.numpyDump(dataSet, 'plate'))
+
+    count, sums, products = 0, np.zeros(len(ftrs)), np.zeros((len(ftrs), len(ftrs)))
+    pool = ProcessPool()
+    for chunkCount, chunkSums, chunkProducts in pool.imap_unordered(correlationSums, [
+            (dataSet, ftrs, means, start, min(start + correlationChunkSize, objectCount))
+            for start in range(0, objectCount, correlationChunkSize)]):
+        count += chunkCount
+        sums += chunkSums
+        products += chunkProducts
+    pool.close()
+    pool.join()
+
+    # Constant features correlate with none.
+    covariance = products / max(count, 1) - np.outer(sums, sums) / max(count, 1)**2
+    deviations = np.sqrt(np.maximum(np.diag(covariance), 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = covariance / np.outer(deviations, deviations)
+    correlation[~np.isfinite(correlation)] = 0
+    correlation = np.clip(correlation, -1, 1)
+    np.fill_diagonal(correlation, 1)
+
+    with open(path + '.part', 'wb') as file:
+        np.save(file, correlation)
+    os.rename(path + '.part', path)
+
+    return correlation
+
+# Image features in optimal leaf order of their correlation dendrogram, persisted next to the data set.
+featureOrderingFile = 'featureOrdering.json'
+
+@lru_cache(maxsize=5, weight=dataSetWeight)
 def featureOrdering(dataSet):
     from ordering.rearrange import rearrange
 
+    path = data.cachePath(dataSet, featureOrderingFile)
+    if os.path.isfile(path):
+        with open(path) as file:
+            stored = json.load(file)
+        if stored['stamp'] == data.stamp(dataSet):
+            return [str(ftr) for ftr in stored['features']]
+
     print "Order features by correlation"
-    objectSet = selectImageFeatures(dataSet, smallSample(dataSet))
-    corr = objectSet.corr()
-    distances = 1 - corr.abs()
-    rearrangedSubset = rearrange(distances.values)
+    distances = 1 - np.abs(featureCorrelation(dataSet))
+    rearrangedSubset = rearrange(distances)
 
     ftrs = data.imageFeatures(dataSet)
-    return [ftrs[i] for i in rearrangedSubset]
+    ordered = [ftrs[i] for i in rearrangedSubset]
+
+    with open(path + '.part', 'w') as file:
+        json.dump({'stamp': data.stamp(dataSet), 'features': ordered}, file)
+    os.rename(path + '.part', path)
 
-@lru_cache(maxsize=5)
+    return ordered
+
+@lru_cache(maxsize=5, weight=dataSetWeight)
 def featureInfo(dataSet):
     return featureOrdering(dataSet)
 
-@synchronized
-@lru_cache(maxsize=1)
+# Seed of training sample selection and classifier training, which makes models reproducible.
+trainingSeed = 0
+predictionChunkSize = 2**16    # Number of objects to classify at a time, which bounds the memory use of prediction.
+
+# Classify a chunk of objects, gathered from the scaled columns, into the label array.
+def predictChunk(args):
+    (dataSet, ftrs, forest, confidenceThreshold, predicted, start) = args
+    chunk = slice(start, start + predictionChunkSize)
+    probabilities = forest.predict_proba(scaledObjects(dataSet, ftrs, chunk))
+    maxProb = np.max(probabilities, axis=1)
+    maxArgProb = np.argmax(probabilities, axis=1)
+    predicted[chunk] = np.where(maxProb > confidenceThreshold, np.choose(maxArgProb, forest.classes_), 2)
+
+# Sorted training object indices and their labels. Consists of a seeded sample of objects with well type annotations,
+# overridden by exemplars that have been chosen by user.
+def trainingSet(dataSet, exemplars, objectCount):
+    objects = []
+    labels = []
+
+    # Sample without N-length temporaries; duplicate draws are dropped.
+    if wellTypes(dataSet):
+        random = np.random.RandomState(trainingSeed)
+        sampleSize = random.binomial(objectCount, configuration(dataSet).wellTypeSample)
+        sampled = np.unique(random.randint(0, objectCount, size=sampleSize))
+        sampledTypes = objectWellTypes(dataSet, sampled)
+        annotated = ~np.isnan(sampledTypes)
+        objects.append(sampled[annotated])
+        labels.append(sampledTypes[annotated].astype(np.float))
+
+    for popId, popObjects in exemplars:
+        objects.append(np.array(sorted(popObjects), dtype=np.int64))
+        labels.append(np.repeat(float(popId), len(popObjects)))
+
+    # Retain last label per object, i.e. exemplars override annotations.
+    objects = np.concatenate(objects)[::-1]
+    labels = np.concatenate(labels)[::-1]
+    objects, last = np.unique(objects, return_index=True)
+    return objects, labels[last]
+
+@lru_cache(maxsize=1, weight=requestWeight)
 def clusters(dataSet, features, exemplars):
     ftrs = list(features)
 
-    wI = wellIndex(dataSet)
-    objectCount = len(wI)
-    predicted = np.empty(objectCount, dtype=np.int)
+    objectCount = len(data.numpyDump(dataSet, 'plate'))
 
     # Default to use all features if none habe been selected.
     if not ftrs:
         ftrs = data.imageFeatures(dataSet)
 
     if ftrs and exemplars:   #(exemplars or wellTypes(dataSet)):
-        # Training feature data.
-        valueMatrix = np.matrix([scaledArray(dataSet, ftr) for ftr in ftrs], copy=False).transpose()
-
-        # Construct from well type annotation.
-        trainingLabels = np.copy(wI['type'].values)
-
-        # Knock out large part of training values (to speed up training).
-        trainingSample = np.random.rand(trainingLabels.size) < configuration(dataSet).wellTypeSample
-        trainingLabels = np.where(trainingSample, trainingLabels, np.nan)
-
-        # Override well type annotations where exemplars have been chosen by user.
-        exemplarDict = dict(exemplars)
-
-        for popId, exemplars in exemplarDict.iteritems():
-            for exemplar in exemplars:
-                trainingLabels[exemplar] = popId
+        # Return labels of a previously trained model.
+        modelKey = modelStore.key(dataSet, ftrs, exemplars, trainingSeed)
+        predicted = modelStore.labels(dataSet, modelKey)
+        if predicted is not None:
+            return predicted
 
-        # Prune training features and labels, based on presence of labels.
-        trainingValues = valueMatrix[~np.isnan(trainingLabels)]
-        trainingLabels = trainingLabels[~np.isnan(trainingLabels)]
+        # Gather training features of labelled objects only.
+        started = time()
+        trainingObjects, trainingLabels = trainingSet(dataSet, exemplars, objectCount)
+        trainingValues = scaledObjects(dataSet, ftrs, trainingObjects)
 
         print "Begin training"
-        #trainingValues = np.take(valueMatrix, exemplarObjects, axis=0)
         forest = RandomForestClassifier(
             n_estimators=10,
             n_jobs=-1,
-            class_weight="balanced"#,
+            class_weight="balanced",
+            random_state=trainingSeed
             #min_samples_split=0.01*trainingValues.size
         )
         forest = forest.fit(trainingValues, trainingLabels)    #forest.fit(trainingValues, exemplarLabels)
+        assert forest.classes_.max() <= np.iinfo(modelStore.labelType).max, "Population id exceeds label type"
         print "End training"
 
         print "Begin classification"
-        #predicted = forest.predict(valueMatrix)
+        # Stream object chunks over threads; trees are evaluated without the GIL.
+        forest.set_params(n_jobs=1)
         confidenceThreshold = data.config(dataSet).classifierConfidenceThreshold
-        probabilities = forest.predict_proba(valueMatrix)
-        maxProb = np.max(probabilities, axis=1)
-        maxArgProb = np.argmax(probabilities, axis=1)
-        predicted = np.where(maxProb > confidenceThreshold, np.choose(maxArgProb, forest.classes_), 2).astype(np.int)
+        predicted = modelStore.labelBuffer(dataSet, modelKey, objectCount)
+
+        pool = Pool()
+        pool.map(predictChunk, [(dataSet, ftrs, forest, confidenceThreshold, predicted, start)
+                                for start in range(0, objectCount, predictionChunkSize)])
+        pool.close()
+        pool.join()
+
+        predicted = modelStore.store(dataSet, modelKey, forest, predicted, time() - started)
         print "End classification"
     else:
-        predicted.fill(2)   # 2 unsure about all input when no training input is provided
+        modelKey = modelStore.key(dataSet, [], [], trainingSeed)
+        predicted = modelStore.labels(dataSet, modelKey)
+        if predicted is None:
+            predicted = modelStore.labelBuffer(dataSet, modelKey, objectCount)
+            predicted.fill(2)   # 2 unsure about all input when no training input is provided
+            predicted = modelStore.store(dataSet, modelKey, None, predicted, 0)
 
     # Partition predicted column to object indices.
     return predicted
 
-@synchronized
-@lru_cache(maxsize=5)
-def clustersAsMap(dataSet, features, exemplars):
-    clst = clusters(dataSet, features, exemplars)
-    ids = np.unique(clst)
-    return {int(id): np.where(clst == int(id))[0] for id in ids}    #(dict(exemplars).keys() if len(exemplars) > 0 and len(features) > 0 else [1])}
+# Population ids that occur in the predicted labels.
+@lru_cache(maxsize=100, weight=requestWeight)
+def populations(dataSet, features, exemplars):
+    return np.flatnonzero(histograms.labelCounts(clusters(dataSet, features, exemplars))).tolist()
 
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=100, weight=requestWeight)
 def closestObject(dataSet, probes):
     result = []
 
     if len(probes) > 0:
-        diffs = [np.square(scaledArray(dataSet, col) - coordinate) for col, coordinate in probes]
-        distances = np.sqrt(np.sum(diffs, axis=0))
-        result = [np.argmin(distances)]
+        # Tree points from the feature-major rows of the probed columns only.
+        points = lambda columns: np.column_stack([scaledArray(dataSet, column) for column in columns])
+        result = [probeIndex.closest(dataSet, list(probes), points)]
 
     return result
 
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=100, weight=requestWeight)
 def allObjects(dataSet, column, row, plate, exemplars, probes):
     allExemplars = list(itertools.chain.from_iterable(cls[1] for cls in exemplars))
-    wellObjectMap = wellToObjects(dataSet)
-    wellObjects = wellObjectMap[(plate, row, column)] if column >= 0 and (plate, row, column) in wellObjectMap else []
+    selectedObjects = wellObjects(dataSet, plate, column, row) if column >= 0 else np.zeros(0, dtype=np.int64)
     probeObject = closestObject(dataSet, probes)
-    return list(set(allExemplars + wellObjects + probeObject))
+    return np.unique(np.concatenate([np.array(allExemplars + probeObject, dtype=np.int64), selectedObjects]))
 
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=None, weight=requestWeight)
 def objectInfo(dataSet, featureSet, column, row, plate, exemplars, probes):
     objects = allObjects(dataSet, column, row, plate, exemplars, probes)
-    combined = wellIndex(dataSet).loc[objects].copy()
+    combined = pd.DataFrame({col: np.take(data.numpyDump(dataSet, col), objects) for col in data.systemObjectColumns},
+                            index=objects)
+    combined['type'] = objectWellTypes(dataSet, objects)
 
     # Feature values.
     for ftr in featureSet:
@@ -259,122 +565,117 @@ def objectInfo(dataSet, featureSet, column, row, plate, exemplars, probes):
     # Predicted population values.
     combined["population"] = np.take(clusters(dataSet, featureSet, exemplars), objects)
 
-    # Generate well URLs on the spot, based on config.
-    wellImages = data.config(dataSet).wellImages
-    for name, urlFunction in wellImages.iteritems():
-        combined["img_" + name] = combined.apply(
-            lambda row: urlFunction(int(row['plate']), int(row['column']), int(row['row'])), axis=1)
+    # Generate well URLs on the spot, based on config, once per distinct well of the objects.
+    wellIds, order, offsets = wellObjectIndex(dataSet)
+    wells, objectWells = np.unique(wellIds[objects], return_inverse=True)
+    coordinates = zip(*wellCoordinates(dataSet, wells))
+    for name, urlFunction in data.config(dataSet).wellImages.iteritems():
+        urls = np.array([urlFunction(int(p), int(c), int(r)) for p, c, r in coordinates], dtype=object)
+        combined["img_" + name] = urls[objectWells]
 
     return combined
 
 def histoLog(counts):
     return np.where(counts > 0, (np.log(counts) / 2 + 1), 0)
 
-def featureHistogram(args):
-    (dataSet, featureSet, exemplars, feature, cluster, bins) = args
-    clusterMap = clustersAsMap(dataSet, featureSet, exemplars)[cluster]
-    prunedColumn = np.take(scaledArray(dataSet, feature), clusterMap)
-    digitized = (prunedColumn * bins).astype(np.int8)
-    return feature, cluster, {i: cnt for i, cnt in enumerate(np.bincount(digitized, minlength=bins))}
+# Histogram counts per cluster and feature, as uint32 arrays.
+@lru_cache(maxsize=None, weight=requestWeight)
+def featureHistogramCounts(dataSet, featureSet, exemplars, bins):
+    labels = clusters(dataSet, featureSet, exemplars)
+    present = populations(dataSet, featureSet, exemplars)
+    index, featureMajor, objectMajor = scaledMatrices(dataSet)
+    ftrs = data.imageFeatures(dataSet)
 
-@lru_cache(maxsize=5)
-def featureHistograms(dataSet, featureSet, exemplars, bins):
-    partition = clustersAsMap(dataSet, featureSet, exemplars)
+    # Histogram cube of all features and clusters, summed over plate shards.
+    cube = shardPool.sumShards(shardPool.featureHistogramsTask, plateShards(dataSet), featureMajor.filename,
+                               [index[feature] for feature in ftrs], labels.filename, present, bins)
 
-    # All computation combinations.
-    #print "Compute feature histograms."
-    tasks = [(dataSet, featureSet, exemplars, feature, cluster, bins)
-             for feature in data.imageFeatures(dataSet)
-             for cluster, clusterMap in partition.iteritems()]
+    counts = {c: {} for c in present}
+    for feature, featureCounts in zip(ftrs, cube):
+        for c, clusterCounts in zip(present, featureCounts):
+            counts[c][feature] = clusterCounts.astype(np.uint32)
 
-    pool = Pool()
-    results = pool.imap(featureHistogram, tasks)
-    pool.close()
-    pool.join()
+    return counts
 
-    histograms = {c: {} for c, table in partition.iteritems()}
-    for feature, cluster, histogram in results:
-        histograms[cluster][feature] = histogram
-    #print "Finish compute feature histograms."
+# Histogram counts per cluster, feature, and bin.
+def featureHistograms(dataSet, featureSet, exemplars, bins):
+    return {c: {feature: dict(enumerate(featureCounts.tolist())) for feature, featureCounts in clusterCounts.iteritems()}
+            for c, clusterCounts in featureHistogramCounts(dataSet, featureSet, exemplars, bins).iteritems()}
 
-    return histograms
+# Well tags of all absolute wells, as plate_column_row strings.
+@lru_cache(maxsize=5, weight=dataSetWeight)
+def wellTags(dataSet):
+    coordinates = wellCoordinates(dataSet, np.arange(wellCount(dataSet)))
+    return np.array(["%d_%d_%d" % well for well in zip(*coordinates)], dtype=object)
 
-@lru_cache(maxsize=5)
+# Population shares and object count ('0') of every well that has objects, indexed by absolute well id.
+@lru_cache(maxsize=None, weight=requestWeight)
 def wellClusterShares(dataSet, features, exemplars):
-    print "Join clustering and well info."
-    sampleWellsClst = wellIndex(dataSet)[['plate', 'column', 'row']].copy()
-    sampleWellsClst['population'] = clusters(dataSet, features, exemplars)
-
-    print "Start pivot table."
-    pivoted = pd.pivot_table(sampleWellsClst,
-                             columns=['population'],
-                             index=['plate', 'column', 'row'],
-                             aggfunc=len)
-    total = pivoted.sum(axis='columns')
-    #maxTotal = total.max()
-    pivoted = pivoted.divide(total, axis='index')
+    wellIds, order, offsets = wellObjectIndex(dataSet)
+    present = populations(dataSet, features, exemplars)
+
+    # Counts per well and cluster, of the wells of every plate shard.
+    counts = np.zeros((wellCount(dataSet), len(present)), dtype=np.int64)
+    labels = clusters(dataSet, features, exemplars)
+    for firstWell, shardCounts in shardPool.mapShards(shardPool.wellHistogramTask, plateShards(dataSet),
+                                                      wellIds.filename, labels.filename, present):
+        counts[firstWell:firstWell + len(shardCounts)] += shardCounts
+
+    total = counts.sum(axis=1)
+    occupied = np.flatnonzero(total)
+    counts = counts[occupied]
+    total = total[occupied]
+
+    # Absent populations have no share.
+    shares = np.where(counts > 0, counts / total[:, np.newaxis].astype(np.float), np.nan)
+    pivoted = pd.DataFrame(shares, index=occupied, columns=pd.Index(present, name='population'))
     pivoted['0'] = total
-    print "Finish pivot table."
 
     return pivoted
 
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=None, weight=requestWeight)
 def wellClusterSharesFlat(dataSet, features, exemplars):
     wellShares = wellClusterShares(dataSet, features, exemplars)
-    wellShares['plate'] = wellShares.index.get_level_values('plate').astype(str)
-    wellShares['column'] = wellShares.index.get_level_values('column').astype(str)
-    wellShares['row'] = wellShares.index.get_level_values('row').astype(str)
-    wellShares['well'] = wellShares['plate'] + "_" + wellShares['column'] + "_" + wellShares['row']
-    return wellShares.set_index('well').drop(['plate', 'column', 'row'], axis=1)
-
-#@lru_cache(maxsize=20)
-def objectHistogram2D(args):
-    (dataSet, features, exemplars, xFeature, yFeature, bins) = args
-    partition = clustersAsMap(dataSet, features, exemplars)
-
-    # Contour maps per cluster.
-    contours = {}
-    #kernel = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]  # Morphology kernel.
-    for cluster, objects in partition.iteritems():
-        tBins = bins - 1
-        xCol = (np.take(scaledArray(dataSet, xFeature), objects) * tBins).astype(np.int)
-        yCol = (np.take(scaledArray(dataSet, yFeature), objects) * tBins).astype(np.int)
-        digitized = (xCol * bins) + yCol
-        counts = np.bincount(digitized, minlength=bins*bins)
-        counts.shape = (bins, bins)
+    return wellShares.set_index(pd.Index(wellTags(dataSet)[wellShares.index.values], name='well'))
 
+# Histogram levels per feature pair and cluster, as float32 (x, y) arrays. Pairs are present in one orientation.
+@lru_cache(maxsize=None, weight=requestWeight)
+def objectHistogramLevels(dataSet, features, exemplars, bins):
+    pairs = [(xFtr, yFtr) for yFtr in features for xFtr in features if xFtr < yFtr]
+    if data.mdsColumnsPresent(dataSet):
+        pairs.append((data.mdsColumns[0], data.mdsColumns[1]))
+
+    # Count all pairs and clusters in a single pass over the objects, summed over plate shards.
+    columns = sorted(set(itertools.chain.from_iterable(pairs)))
+    columnIndex = {column: i for i, column in enumerate(columns)}
+    present = populations(dataSet, features, exemplars)
+    index, featureMajor, objectMajor = scaledMatrices(dataSet)
+    counts = shardPool.sumShards(shardPool.pairHistogramsTask, plateShards(dataSet), featureMajor.filename,
+                                 [index[column] for column in columns],
+                                 clusters(dataSet, features, exemplars).filename,
+                                 [(columnIndex[xFtr], columnIndex[yFtr]) for xFtr, yFtr in pairs],
+                                 present,
+                                 bins)
+
+    levels = defaultdict(dict)
+    for (xFeature, yFeature), pairCounts in zip(pairs, counts):
         # Scale histogram densities to base 10 logarithm levels.
-        levels = histoLog(counts)   #.astype(np.int8)
-
-        # Level set outlines as contours (retain level as outline number).
-        #eroded = grey_erosion(levels, footprint=kernel, mode='constant')
-        #difference = np.sign(levels - eroded)
-        #levelContours = np.multiply(difference, levels)
+        levels[xFeature][yFeature] = {str(cluster): histoLog(clusterCounts).astype(np.float32)
+                                      for cluster, clusterCounts in zip(present, pairCounts)}
 
-        #contours[str(cluster)] = levelContours
-
-        contours[str(cluster)] = levels
-
-    return xFeature, yFeature, contours
+    return dict(levels)
 
+# Histogram levels per feature pair and cluster, as nested lists in both orientations of a pair.
 def objectHistogramMatrix(dataSet, features, exemplars, bins):
-    tasks = [(dataSet, features, exemplars, xFtr, yFtr, bins) for yFtr in features for xFtr in features if xFtr < yFtr]
-    if data.mdsColumnsPresent(dataSet):
-        tasks.append((dataSet, features, exemplars, data.mdsColumns[0], data.mdsColumns[1], bins))
-
-    pool = Pool()
-    results = pool.imap(objectHistogram2D, tasks)
-    pool.close()
-    pool.join()
-
     recDict = lambda: defaultdict(recDict)
-    histograms = recDict()
-    for xFeature, yFeature, contours in results:
-        for c, lvlCnt in contours.iteritems():
-            histograms[xFeature][yFeature][c] = lvlCnt.tolist()
-            histograms[yFeature][xFeature][c] = lvlCnt.transpose().tolist()
-
-    return dict(histograms)
+    histograms2D = recDict()
+    for xFeature, yLevels in objectHistogramLevels(dataSet, features, exemplars, bins).iteritems():
+        for yFeature, clusterLevels in yLevels.iteritems():
+            for c, lvlCnt in clusterLevels.iteritems():
+                histograms2D[xFeature][yFeature][c] = lvlCnt.tolist()
+                histograms2D[yFeature][xFeature][c] = lvlCnt.transpose().tolist()
+
+    return dict(histograms2D)
 
 def forObjectFeatureValues(args):
     (dataSet, col, objects) = args
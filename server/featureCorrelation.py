@@ -0,0 +1,16 @@
+import tangelo
+tangelo.paths(".")
+import compute
+import json
+import wire
+
+@tangelo.types(dataSet=compute.dataSet, encoding=wire.encoding)
+def run(dataSet, encoding='json'):
+    ftrs = compute.data.imageFeatures(dataSet)
+    correlation = compute.featureCorrelation(dataSet)
+    result = {'features': ftrs, 'ordering': compute.featureOrdering(dataSet), 'correlation': correlation}
+    if wire.isBinary(encoding):
+        tangelo.content_type(wire.contentType)
+        return wire.encode(result)
+    result['correlation'] = correlation.tolist()
+    return json.dumps(result)
@@ -2,7 +2,12 @@ import tangelo
 tangelo.paths(".")
 import compute
 import json
+import wire
 
-@tangelo.types(dataSet=compute.dataSet, features=compute.featureSet, exemplars=compute.exemplarDict, bins=int)
-def run(dataSet, features, exemplars, bins):
+@tangelo.types(dataSet=compute.dataSet, features=compute.featureSet, exemplars=compute.exemplarDict, bins=int,
+               encoding=wire.encoding)
+def run(dataSet, features, exemplars, bins, encoding='json'):
+    if wire.isBinary(encoding):
+        tangelo.content_type(wire.contentType)
+        return wire.encode(compute.featureHistogramCounts(dataSet, features, exemplars, bins))
     return json.dumps(compute.featureHistograms(dataSet, features, exemplars, bins))
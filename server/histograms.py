@@ -0,0 +1,68 @@
+import numpy as np
+
+# Histogram engine: every selected column is quantized once per chunk of objects, and the cluster of an object
+# is folded into its bin index, so that the histograms of all clusters are counted by a single bincount.
+
+chunkSize = 2**20   # Number of objects to quantize and count at a time.
+
+# Object counts per label.
+def labelCounts(labels):
+    counts = np.zeros(0, dtype=np.int64)
+    for start in range(0, len(labels), chunkSize):
+        chunkCounts = np.bincount(labels[start:start + chunkSize])
+        if len(chunkCounts) > len(counts):
+            counts = np.concatenate([counts, np.zeros(len(chunkCounts) - len(counts), dtype=np.int64)])
+        counts[:len(chunkCounts)] += chunkCounts
+    return counts
+
+# Lookup table from label to dense cluster index, for the given cluster labels.
+def clusterTable(clusters):
+    table = np.zeros(max(clusters) + 1 if len(clusters) > 0 else 0, dtype=np.int64)
+    table[list(clusters)] = np.arange(len(clusters))
+    return table
+
+# Bin indices of scaled values in [0, 1], where 1 maps to the last bin.
+def quantize(values, bins):
+    return np.clip((values * (bins - 1)).astype(np.int32), 0, bins - 1)
+
+# 2D histogram counts of column pairs, as a (pair, cluster, bins, bins) array for the given cluster labels.
+def pairHistograms(columns, labels, pairs, clusters, bins):
+    table = clusterTable(clusters)
+    cells = len(clusters) * bins * bins
+    counts = np.zeros((len(pairs), cells), dtype=np.int64)
+
+    for start in range(0, len(labels), chunkSize):
+        offsets = table[labels[start:start + chunkSize]] * (bins * bins)
+        quantized = [quantize(column[start:start + chunkSize], bins) for column in columns]
+        for i, (x, y) in enumerate(pairs):
+            counts[i] += np.bincount(offsets + quantized[x] * bins + quantized[y], minlength=cells)
+
+    return counts.reshape((len(pairs), len(clusters), bins, bins))
+
+# Bin indices of scaled values in [0, 1] for 1D histograms, where 1 is included in the last bin.
+def digitize(values, bins):
+    return np.clip((values * bins).astype(np.int32), 0, bins - 1)
+
+# 1D histogram counts of a column, as a (cluster, bins) array for the given cluster labels.
+def featureHistogram(column, labels, clusters, bins):
+    table = clusterTable(clusters)
+    cells = len(clusters) * bins
+    counts = np.zeros(cells, dtype=np.int64)
+
+    for start in range(0, len(labels), chunkSize):
+        offsets = table[labels[start:start + chunkSize]] * bins
+        counts += np.bincount(offsets + digitize(column[start:start + chunkSize], bins), minlength=cells)
+
+    return counts.reshape((len(clusters), bins))
+
+# Object counts per well and cluster, as a (well, cluster) array for the given cluster labels.
+def wellHistogram(wellIds, labels, wellCount, clusters):
+    table = clusterTable(clusters)
+    cells = wellCount * len(clusters)
+    counts = np.zeros(cells, dtype=np.int64)
+
+    for start in range(0, len(labels), chunkSize):
+        codes = wellIds[start:start + chunkSize].astype(np.int64) * len(clusters) + table[labels[start:start + chunkSize]]
+        counts += np.bincount(codes, minlength=cells)
+
+    return counts.reshape((wellCount, len(clusters)))
@@ -0,0 +1,172 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool as ProcessPool
+import numpyData
+import compute
+
+# Streaming ingest of per well feature files (<input>/<plate>/<plate><column><row>_ftrs.tab, tab-separated with a
+# header) into the NumPy columns of a data set, plate by plate in a process pool. Rows are laid out by plate, column,
+# and row, at offsets that are counted up front, so every worker writes typed values straight into preallocated
+# memory-mapped columns. Feature metrics and the well index are gathered in the same pass and written to the cache
+# of the data set, next to the columns. Run from the server directory, after placing the config.py of the data set:
+#
+#   python ingest.py CellMorph /path/to/cellmorph/data/
+
+excludedColumns = ['class', 'spot']
+spotOffsets = {2: (673.0, 0.0), 3: (0.0, 512.0), 4: (673.0, 512.0)}   # Well image offset of CellMorph spots.
+
+def wellPath(inputPath, plateTag, columnTag, rowTag):
+    return os.path.join(inputPath, plateTag, plateTag + columnTag + rowTag + "_ftrs.tab")
+
+# Number of objects per well of a plate, by counting data lines.
+def countPlate(args):
+    (inputPath, plateTag, columnTags, rowTags) = args
+    counts = np.zeros((len(columnTags), len(rowTags)), dtype=np.int64)
+    for c, columnTag in enumerate(columnTags):
+        for r, rowTag in enumerate(rowTags):
+            path = wellPath(inputPath, plateTag, columnTag, rowTag)
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    counts[c, r] = max(sum(1 for line in file if line.strip()) - 1, 0)
+            else:
+                print "Well " + plateTag + columnTag + rowTag + " has no file."
+    return counts
+
+# Column types, as int32 or float32 per numeric column of the first well file.
+def columnTypes(path):
+    sample = pd.read_csv(path, sep='\t', nrows=100)
+    types = {}
+    for name, values in sample.iteritems():
+        if name in excludedColumns:
+            continue
+        if values.dtype.kind in 'iu':
+            types[name] = np.int32
+        elif values.dtype.kind == 'f':
+            types[name] = np.float32
+        else:
+            print "Skip non-numeric column " + name
+    return types
+
+# Parse the wells of a plate into the columns, and return the chunk metrics of every well per feature column.
+def fillPlate(args):
+    (inputPath, columnPath, plate, plateTag, columnTags, rowTags, counts, start, types, features) = args
+    columns = {name: np.load(os.path.join(columnPath, name + '.npy'), mmap_mode='r+') for name in types}
+    columns.update({name: np.load(os.path.join(columnPath, name + '.npy'), mmap_mode='r+')
+                    for name in ['plate', 'column', 'row']})
+    metrics = {ftr: [] for ftr in features}
+
+    offset = start
+    for c, columnTag in enumerate(columnTags):
+        for r, rowTag in enumerate(rowTags):
+            if counts[c, r] == 0:
+                continue
+            frame = pd.read_csv(wellPath(inputPath, plateTag, columnTag, rowTag), sep='\t')
+            assert len(frame) == counts[c, r], "Well " + plateTag + columnTag + rowTag + " changed while ingesting"
+            rows = slice(offset, offset + len(frame))
+
+            # Correct well coordinates to account for spot.
+            if 'spot' in frame:
+                for spot, (dx, dy) in spotOffsets.iteritems():
+                    inSpot = (frame['spot'] == spot).values
+                    frame.loc[inSpot, 'x'] += dx
+                    frame.loc[inSpot, 'y'] += dy
+
+            columns['plate'][rows] = plate
+            columns['column'][rows] = c
+            columns['row'][rows] = r
+            for name, dtype in types.iteritems():
+                values = frame[name].values.astype(dtype)
+                columns[name][rows] = values
+                if name in metrics:
+                    metrics[name].append(compute.chunkMetrics(values))
+
+            offset += len(frame)
+
+    for column in columns.values():
+        column.flush()
+    print "Ingested plate " + plateTag
+    return metrics
+
+def ingest(dataSet, inputPath, processes=None):
+    cfg = numpyData.config(dataSet)
+    plateTags, columnTags, rowTags = list(cfg.plates), list(cfg.columns), list(cfg.rows)
+    columnPath = numpyData.numpyPaths[dataSet]
+    if not os.path.isdir(columnPath):
+        os.makedirs(columnPath)
+    pool = ProcessPool(processes)
+
+    # Objects per well, and plate row offsets, in plate, column, and row order.
+    counts = np.array(pool.map(countPlate, [(inputPath, plateTag, columnTags, rowTags) for plateTag in plateTags]))
+    objectCount = int(counts.sum())
+    plateStarts = np.concatenate([[0], np.cumsum(counts.reshape(len(plateTags), -1).sum(axis=1))])
+    print "Ingest " + str(objectCount) + " objects of " + dataSet
+
+    firstWell = next(wellPath(inputPath, plateTags[p], columnTags[c], rowTags[r])
+                     for p, c, r in zip(*np.nonzero(counts)))
+    types = columnTypes(firstWell)
+    features = [name for name in types if name not in numpyData.systemObjectColumns]
+
+    # Preallocate columns.
+    for name, dtype in types.items() + [('plate', np.int32), ('column', np.int32), ('row', np.int32)]:
+        np.lib.format.open_memmap(os.path.join(columnPath, name + '.npy'), mode='w+', dtype=dtype,
+                                  shape=(objectCount,))
+
+    plateMetrics = pool.map(fillPlate, [(inputPath, columnPath, p, plateTag, columnTags, rowTags, counts[p],
+                                         plateStarts[p], types, features) for p, plateTag in enumerate(plateTags)])
+    pool.close()
+    pool.join()
+
+    # Feature metrics and well index, stamped by the columns that were just written. Metrics of other feature columns,
+    # such as MDS columns that are already in place, are computed from the columns.
+    metrics = {}
+    for ftr in numpyData.features(dataSet):
+        if ftr in features:
+            metrics[ftr] = compute.metricsOf([part for plate in plateMetrics for part in plate[ftr]], objectCount)
+        else:
+            metrics[ftr] = compute.columnMetrics(numpyData.numpyDump(dataSet, ftr))
+    writeMetrics(dataSet, metrics)
+    writeWellIndex(dataSet, counts.ravel())
+
+def writeMetrics(dataSet, metrics):
+    path = numpyData.cachePath(dataSet, compute.metricsFile)
+    with open(path + '.part', 'w') as file:
+        json.dump({'stamp': numpyData.stamp(dataSet), 'metrics': metrics}, file)
+    os.rename(path + '.part', path)
+
+# Well index of objects that are laid out by well: consecutive well ids, the identity order, and count offsets.
+def writeWellIndex(dataSet, counts):
+    objectCount = int(counts.sum())
+    idsPath = numpyData.cachePath(dataSet, compute.wellIdsFile)
+    orderPath = numpyData.cachePath(dataSet, compute.wellOrderFile)
+    offsetsPath = numpyData.cachePath(dataSet, compute.wellOffsetsFile)
+
+    wellIds = np.lib.format.open_memmap(idsPath + '.part', mode='w+', dtype=np.int32, shape=(objectCount,))
+    order = np.lib.format.open_memmap(orderPath + '.part', mode='w+',
+                                      dtype=np.int32 if objectCount < 2**31 else np.int64, shape=(objectCount,))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    for well in np.flatnonzero(counts):
+        wellIds[offsets[well]:offsets[well + 1]] = well
+    for start in range(0, objectCount, compute.wellChunkSize):
+        end = min(start + compute.wellChunkSize, objectCount)
+        order[start:end] = np.arange(start, end)
+
+    wellIds.flush()
+    order.flush()
+    del wellIds, order
+    with open(offsetsPath + '.part', 'wb') as file:
+        np.save(file, offsets)
+    os.rename(idsPath + '.part', idsPath)
+    os.rename(orderPath + '.part', orderPath)
+    os.rename(offsetsPath + '.part', offsetsPath)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest per well feature files into the columns of a data set.")
+    parser.add_argument('dataSet', help="data set name, with its config.py in ../dataset/<dataSet>/")
+    parser.add_argument('inputPath', help="directory of plate directories with per well _ftrs.tab files")
+    parser.add_argument('--processes', type=int, default=None)
+    arguments = parser.parse_args()
+
+    ingest(arguments.dataSet, arguments.inputPath, arguments.processes)
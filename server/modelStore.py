@@ -0,0 +1,115 @@
+import os
+import json
+import weakref
+import hashlib
+import cPickle as pickle
+import numpy as np
+from threading import RLock
+import blockData as data
+import cache
+
+# Store of fitted classifiers and their predicted object labels, by model key. Forests are kept in memory under the
+# shared cache budget, while labels are persisted as int16 arrays in the data set cache and memory-mapped from there.
+# Evicting a model only drops its forest, so that its labels are reloaded from disk, also after a restart. At most
+# storedLabels label files are kept per data set, where files whose labels are still referenced are never deleted.
+
+labelType = np.int16        # Population ids count up from 100 on the client, which outgrows int8.
+storedLabels = 16           # Number of label files to keep on disk per data set, least recently used go first.
+
+models = {}                 # Model key to fitted forest.
+mapped = weakref.WeakValueDictionary()  # Label file path to its memory map, while the labels are referenced.
+modelLock = RLock()
+
+# Model key of a data set, feature list, exemplar set, and training seed combination, and of the configuration
+# settings that training and prediction depend on, so that labels on disk are not reused after config.py changes.
+def key(dataSet, features, exemplars, seed):
+    cfg = data.config(dataSet)
+    settings = [cfg.classifierConfidenceThreshold, getattr(cfg, 'wellTypeSample', None)]
+    exemplarList = sorted([(str(popId), sorted(objects)) for popId, objects in exemplars])
+    description = json.dumps([dataSet, sorted(features), exemplarList, seed, settings])
+    return hashlib.sha1(description).hexdigest()
+
+def labelPath(dataSet, modelKey):
+    return data.cachePath(dataSet, 'labels_' + modelKey + '.npy')
+
+# Predicted labels of a model, from their memory map or from disk. None if the model is not known.
+def labels(dataSet, modelKey):
+    path = labelPath(dataSet, modelKey)
+    with modelLock:
+        if modelKey in models:
+            cache.touch(discard, modelKey)
+        predicted = mapped.get(os.path.abspath(path))
+    if predicted is not None:
+        return predicted
+
+    if os.path.isfile(path):
+        os.utime(path, None)    # Mark as recently used.
+        return mapLabels(path)
+
+    return None
+
+# Writable label array for a model that is being predicted, to be committed by store.
+def labelBuffer(dataSet, modelKey, objectCount):
+    return np.lib.format.open_memmap(labelPath(dataSet, modelKey) + '.part', mode='w+', dtype=labelType,
+                                     shape=(objectCount,))
+
+# Persist predicted labels that were written to a label buffer, and keep the forest in memory,
+# where cost is the time in seconds that it took to train and predict.
+def store(dataSet, modelKey, forest, buffer, cost):
+    buffer.flush()
+    del buffer
+    path = labelPath(dataSet, modelKey)
+    os.rename(path + '.part', path)
+    predicted = mapLabels(path)
+    if forest is not None:
+        keep(modelKey, forest, cost)
+    prune(dataSet)
+    return predicted
+
+# Memory-mapped labels of a label file, which protect the file from pruning while they are referenced, for instance
+# by the cached clusters result or by a request that hands the file to shard workers.
+def mapLabels(path):
+    predicted = np.load(path, mmap_mode='r')
+    with modelLock:
+        mapped[os.path.abspath(path)] = predicted
+    return predicted
+
+# Delete the least recently used label files of a data set beyond storedLabels, except those in use.
+def prune(dataSet):
+    directory = os.path.dirname(labelPath(dataSet, ''))
+    with modelLock:
+        held = set(mapped.keys())
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.startswith('labels_') and name.endswith('.npy')]
+    stored = []
+    for path in paths:
+        try:
+            stored.append((os.path.getmtime(path), path))
+        except OSError:
+            pass    # Deleted concurrently.
+    for mtime, path in sorted(stored, reverse=True)[storedLabels:]:
+        if os.path.abspath(path) not in held:
+            remove(path)
+
+def remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass    # Deleted concurrently.
+
+# Keep a fitted forest in memory under the budget.
+def keep(modelKey, forest, cost):
+    with modelLock:
+        models[modelKey] = forest
+    cache.admit(discard, modelKey, forest, cost, len(pickle.dumps(forest, pickle.HIGHEST_PROTOCOL)))
+
+# Drop a forest that was evicted from the cache budget. The label file stays on disk.
+def discard(modelKey, forest):
+    with modelLock:
+        if models.get(modelKey) is forest:
+            del models[modelKey]
+
+# Fitted forest of a model, if it is still held in memory.
+def forest(modelKey):
+    with modelLock:
+        return models.get(modelKey)
@@ -1,9 +1,14 @@
 import os
+import imp
+import types
+import hashlib
+import shutil
 import numpy as np
 import pandas as pd
 import random
 import csv
 from collections import defaultdict
+from threading import RLock
 
 # Required (non-image feature) columns.
 systemObjectColumns = ['plate', 'column', 'row', 'x', 'y']
@@ -14,11 +19,68 @@ dataPath = '../dataset/'
 dataSetPaths = {o: os.path.join(dataPath, o) for o in os.listdir(dataPath) if os.path.isdir(os.path.join(dataPath, o))}
 numpyPaths = {o: path + '/columns/' for o, path in dataSetPaths.iteritems()}
 
-# Configuration file of given data set.
+# Immutable snapshot of a data set configuration module, where lists are frozen to tuples.
+class Configuration(object):
+    def __init__(self, module):
+        for name, value in vars(module).iteritems():
+            if not name.startswith('_') and not isinstance(value, types.ModuleType):
+                object.__setattr__(self, name, tuple(value) if isinstance(value, list) else value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Data set configuration is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("Data set configuration is read-only")
+
+# Loaded configurations, by data set, as (modification time, configuration) pairs.
+configs = {}
+configLock = RLock()
+
+# Configuration file of given data set, loaded once and reloaded when the file is modified.
 def config(dataSet):
-    import imp
-    print "Load: " + '../dataset/' + dataSet + '/config.py'
-    return imp.load_source('config', '../dataset/' + dataSet + '/config.py')
+    path = os.path.join(dataSetPaths[dataSet], 'config.py')
+    modified = os.stat(path).st_mtime
+    loaded = configs.get(dataSet)
+    if loaded is None or loaded[0] != modified:
+        with configLock:
+            loaded = configs.get(dataSet)
+            if loaded is None or loaded[0] != modified:
+                print "Load: " + path
+                module = imp.load_source('config_' + hashlib.sha1(dataSet).hexdigest()[:8], path)
+                loaded = (modified, Configuration(module))
+                configs[dataSet] = loaded
+    return loaded[1]
+
+# Fingerprint of the column files of a data set, derived data is stored under this stamp.
+stamps = {}
+def stamp(dataSet):
+    if dataSet not in stamps:
+        digest = hashlib.sha1()
+        for file in sorted(os.listdir(numpyPaths[dataSet])):
+            if file.endswith(".npy"):
+                status = os.stat(numpyPaths[dataSet] + file)
+                digest.update("%s:%d:%d;" % (file, status.st_size, int(status.st_mtime)))
+        stamps[dataSet] = digest.hexdigest()[:16]
+    return stamps[dataSet]
+
+# Delete the derived data of earlier stamps of a data set, i.e. of columns that have been replaced since.
+def removeStaleCaches(dataSet):
+    directory = os.path.join(dataSetPaths[dataSet], 'cache')
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name != stamp(dataSet) and os.path.isdir(path):
+            print "Remove stale cache " + path
+            shutil.rmtree(path, ignore_errors=True)
+
+# Path of a derived data file of given data set, invalidated when its columns change.
+def cachePath(dataSet, fileName):
+    directory = os.path.join(dataSetPaths[dataSet], 'cache', stamp(dataSet))
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass    # Created concurrently.
+    return os.path.join(directory, fileName)
 
 def objectColumns(dataSet):
     return [os.path.splitext(os.path.basename(file))[0] for file in os.listdir(numpyPaths[dataSet]) if file.endswith(".npy")]
@@ -45,11 +107,35 @@ def numpyDump(dataSet, column):
 def columnsDump(dataSet, columns):
     return pd.DataFrame({col: numpyDump(dataSet, col) for col in columns})
 
-def objectSample(dataSet, size):
-    columns = objectColumns(dataSet)
-    index = range(len(columnsDump(dataSet, ['plate'])))
-    indexSample = random.sample(index, size)
-    return pd.DataFrame({col: np.take(numpyDump(dataSet, col), indexSample) for col in columns}, index=indexSample)
+# Number of objects, from the array header of a column.
+def objectCount(dataSet):
+    return len(numpyDump(dataSet, 'plate'))
+
+# Sorted sample of size positions out of count, drawn with the given seed in O(size) memory. Optional offsets delimit
+# consecutive strata, from 0 to count, of which every one is sampled in proportion to its size.
+def sampleIndices(count, size, seed=0, offsets=None):
+    generator = random.Random(seed)
+    if size >= count:
+        return np.arange(count)
+    if offsets is None:
+        return np.sort(np.array(generator.sample(xrange(count), size), dtype=np.int64))
+
+    # Systematic quota per stratum, from a seeded start: the floor or ceiling of its proportional share, with the
+    # share as expectation, also when there are more strata than the sample size.
+    offsets = np.asarray(offsets, dtype=np.int64)
+    sizes = np.diff(offsets)
+    boundaries = np.floor(size * offsets.astype(np.float64) / count + generator.random()).astype(np.int64)
+    quotas = np.diff(boundaries)
+    positions = [offsets[s] + np.array(generator.sample(xrange(sizes[s]), quotas[s]), dtype=np.int64)
+                 for s in np.flatnonzero(quotas)]
+    return np.sort(np.concatenate(positions))
+
+# Columns of given objects, in a data frame indexed by object id.
+def objectRows(dataSet, objects):
+    return pd.DataFrame({col: numpyDump(dataSet, col)[objects] for col in objectColumns(dataSet)}, index=objects)
+
+def objectSample(dataSet, size, seed=0):
+    return objectRows(dataSet, sampleIndices(objectCount(dataSet), size, seed))
 
 # Well annotation data.
 wellPaths = {o: path + '/wells.tab' for o, path in dataSetPaths.iteritems()}
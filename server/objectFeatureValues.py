@@ -1,7 +1,14 @@
 import tangelo
 tangelo.paths(".")
 import compute
+import numpy as np
+import wire
 
-@tangelo.types(dataSet=compute.dataSet, column=int, row=int, plate=int, exemplars=compute.exemplarDict, probes=compute.objectDict)
-def run(dataSet, column, row, plate, exemplars, probes):
-    return compute.objectFeatureValues(dataSet, column, row, plate, exemplars, probes).to_json()
+@tangelo.types(dataSet=compute.dataSet, column=int, row=int, plate=int, exemplars=compute.exemplarDict, probes=compute.objectDict,
+               encoding=wire.encoding)
+def run(dataSet, column, row, plate, exemplars, probes, encoding='json'):
+    values = compute.objectFeatureValues(dataSet, column, row, plate, exemplars, probes)
+    if wire.isBinary(encoding):
+        tangelo.content_type(wire.contentType)
+        return wire.encode(wire.frame(values, np.float32))
+    return values.to_json()
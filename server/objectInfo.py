@@ -1,7 +1,13 @@
 import tangelo
 tangelo.paths(".")
 import compute
+import wire
 
-@tangelo.types(dataSet=compute.dataSet, features=compute.featureSet, column=int, row=int, plate=int, exemplars=compute.exemplarDict, probes=compute.objectDict)
-def run(dataSet, features, column, row, plate, exemplars, probes):
-    return compute.objectInfo(dataSet, features, column, row, plate, exemplars, probes).to_json()
+@tangelo.types(dataSet=compute.dataSet, features=compute.featureSet, column=int, row=int, plate=int, exemplars=compute.exemplarDict, probes=compute.objectDict,
+               encoding=wire.encoding)
+def run(dataSet, features, column, row, plate, exemplars, probes, encoding='json'):
+    info = compute.objectInfo(dataSet, features, column, row, plate, exemplars, probes)
+    if wire.isBinary(encoding):
+        tangelo.content_type(wire.contentType)
+        return wire.encode(wire.frame(info))
+    return info.to_json()
@@ -0,0 +1,81 @@
+import numpy as np
+
+# Optimal leaf ordering of a binary dendrogram, as in barjoseph.optimal [Bar-Joseph et al., 2003], but iterative and
+# on arrays. Subtrees are visited bottom-up in linkage order. Every pair of leaves (i, j) has a single least common
+# ancestor, so one n by n matrix holds the maximal similarity of all subtree orders from leftmost leaf i to rightmost
+# leaf j, and two more hold the inner leaves (k, m) that realize it. This takes O(n^3) time and O(n^2) memory.
+
+blockSize = 2**22   # Number of (max, +) terms to evaluate at a time.
+
+# Leaf order of linkage Z, that maximizes the summed similarity S of neighbouring leaves.
+def optimalLeafOrder(Z, S):
+    Z = np.asarray(Z)
+    S = np.asarray(S, dtype=np.float64)
+    n = len(Z) + 1
+    if n == 1:
+        return [0]
+    left, right = Z[:, 0].astype(np.int64), Z[:, 1].astype(np.int64)
+
+    # Leaves of every subtree, as a range of the dendrogram leaf order.
+    sizes = np.ones(2 * n - 1, dtype=np.int64)
+    for v in range(len(Z)):
+        sizes[n + v] = sizes[left[v]] + sizes[right[v]]
+    starts = np.zeros(2 * n - 1, dtype=np.int64)
+    for v in reversed(range(len(Z))):
+        starts[left[v]] = starts[n + v]
+        starts[right[v]] = starts[n + v] + sizes[left[v]]
+    leafOrder = np.empty(n, dtype=np.int64)
+    leafOrder[starts[:n]] = np.arange(n)
+
+    def leaves(v):
+        return leafOrder[starts[v]:starts[v] + sizes[v]]
+
+    # Leaf groups of a subtree, each with the leaves that can end an order that starts at the group.
+    def sides(v):
+        if v < n:
+            return [(leaves(v), leaves(v))]
+        return [(leaves(left[v - n]), leaves(right[v - n])), (leaves(right[v - n]), leaves(left[v - n]))]
+
+    M = np.zeros((n, n))
+    K = np.zeros((n, n), dtype=np.int64)    # Rightmost leaf of the left part of the order from i to j.
+    L = np.zeros((n, n), dtype=np.int64)    # Leftmost leaf of the right part of the order from i to j.
+
+    for v in range(len(Z)):
+        for I, Ks in sides(left[v]):
+            for J, Ls in sides(right[v]):
+                # In blocks of leaves i, best inner leaf k per (i, l), and then best inner leaf l per (i, j).
+                rows = max(1, blockSize // (len(Ls) * max(len(Ks), len(J))))
+                for start in range(0, len(I), rows):
+                    Ib = I[start:start + rows]
+                    inner = M[np.ix_(Ib, Ks)][:, :, np.newaxis] + S[np.ix_(Ks, Ls)][np.newaxis]
+                    innerK = Ks[np.argmax(inner, axis=1)]
+                    totals = np.max(inner, axis=1)[:, :, np.newaxis] + M[np.ix_(Ls, J)][np.newaxis]
+                    best = np.argmax(totals, axis=1)
+
+                    i, j = np.ix_(Ib, J)
+                    M[i, j] = np.max(totals, axis=1)
+                    K[i, j] = innerK[np.arange(len(Ib))[:, np.newaxis], best]
+                    L[i, j] = Ls[best]
+
+                    # The order from j to i is the reverse of the order from i to j.
+                    M[j.T, i.T] = M[i, j].T
+                    K[j.T, i.T] = L[i, j].T
+                    L[j.T, i.T] = K[i, j].T
+
+    root = 2 * n - 2
+    I, J = leaves(left[root - n]), leaves(right[root - n])
+    best = np.argmax(M[np.ix_(I, J)])
+    return unfold(I[best // len(J)], J[best % len(J)], K, L)
+
+# Leaf order from i to j, from the inner leaves that realize it.
+def unfold(i, j, K, L):
+    order = []
+    stack = [(i, j)]
+    while stack:
+        i, j = stack.pop()
+        if i == j:
+            order.append(int(i))
+        else:
+            stack.append((L[i, j], j))
+            stack.append((i, K[i, j]))
+    return order
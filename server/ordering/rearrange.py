@@ -1,4 +1,4 @@
-from math import exp
+import numpy as np
 from scipy.spatial.distance import pdist, squareform
 from scipy.cluster.hierarchy import linkage, leaves_list
 import pandas as pd
@@ -12,20 +12,13 @@ def rearrange(X, optimal = True, method = "average"):
 
     leaves = list(leaves_list(Z))
     N      = len(leaves)
-    root   = len(Z)+N-1
 
     assert len(X) == N
 
     # bar-joseph optimal ordering
     if optimal:
-        import barjoseph
-        leaves = barjoseph.optimal(root, **{
-            "S":        lambda i, j: exp(-X[i][j]),
-            "left":     lambda i: None if i < N else Z[i-N][0],
-            "right":    lambda i: None if i < N else Z[i-N][1],
-            "is_leaf":  lambda i: i < N,
-            "is_empty": lambda v: v is None,
-        })
+        from leafOrdering import optimalLeafOrder
+        leaves = optimalLeafOrder(Z, np.exp(-np.asarray(X, dtype=np.float64)))
 
     assert list(sorted(leaves)) == list(range(N))
 
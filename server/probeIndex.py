@@ -0,0 +1,40 @@
+import cache
+from time import time
+from threading import RLock
+from scipy.spatial import cKDTree
+
+# Spatial indices of scaled object coordinates for probe lookups, by data set and probed column combination.
+# Trees are built on first use and kept in memory under the shared cache budget.
+
+leafSize = 32               # Objects per tree leaf.
+
+trees = {}                  # (data set, columns) key to tree.
+treeLock = RLock()
+
+# Tree of the given key, where points provides the object-major coordinates if the tree has to be built.
+def tree(key, points):
+    with treeLock:
+        if key in trees:
+            cache.touch(discard, key)
+            return trees[key]
+
+    print "Build probe index of " + str(key)
+    start = time()
+    built = cKDTree(points(), leafsize=leafSize, balanced_tree=False)
+    with treeLock:
+        trees[key] = built
+    cache.admit(discard, key, built, time() - start, built.data.nbytes + built.indices.nbytes)
+    return built
+
+# Drop a tree that was evicted from the cache budget.
+def discard(key, built):
+    with treeLock:
+        if trees.get(key) is built:
+            del trees[key]
+
+# Object closest to the given coordinates, where coordinates is a list of (column, value) pairs.
+def closest(dataSet, coordinates, points):
+    columns = tuple(sorted(set(column for column, value in coordinates)))
+    values = dict(coordinates)
+    distance, nearest = tree((dataSet, columns), lambda: points(columns)).query([values[c] for c in columns])
+    return int(nearest)
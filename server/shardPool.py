@@ -0,0 +1,91 @@
+import atexit
+import numpy as np
+from threading import RLock
+from multiprocessing import Pool as ProcessPool
+import histograms
+
+# Plate-sharded execution backend: a persistent pool of worker processes, that are handed shards of whole wells of
+# a single plate. Shards are ranges of the well-sorted objects of the compressed well index, so objects need not be
+# laid out by plate. Workers map the files of a shard by path and return partial results, such as histogram counts,
+# that the parent merges.
+
+shardSize = 2**22   # Number of objects per shard, unless a single well holds more.
+
+workers = None
+workerLock = RLock()
+
+# Worker pool, started on first use and kept for the lifetime of the server.
+def pool():
+    global workers
+    with workerLock:
+        if workers is None:
+            workers = ProcessPool()
+            atexit.register(close)
+        return workers
+
+def close():
+    global workers
+    with workerLock:
+        if workers is not None:
+            workers.terminate()
+            workers.join()
+            workers = None
+
+# Shards of the well-sorted objects at orderPath, as (orderPath, start, end, first well, end well) tuples, where
+# offsets are the per well offsets into the well-sorted objects. Empty shards are left out.
+def plateShards(orderPath, offsets, wellsPerPlate):
+    shards = []
+    wells = len(offsets) - 1
+    for plateStart in range(0, wells, wellsPerPlate):
+        plateEnd = min(plateStart + wellsPerPlate, wells)
+        first = plateStart
+        while first < plateEnd:
+            last = min(max(np.searchsorted(offsets, offsets[first] + shardSize, side='right') - 1, first + 1), plateEnd)
+            if offsets[last] > offsets[first]:
+                shards.append((orderPath, int(offsets[first]), int(offsets[last]), first, last))
+            first = last
+    return shards
+
+# Results of task per shard, in order of completion, where task takes a shard and the given arguments.
+def mapShards(task, shards, *args):
+    return pool().imap_unordered(task, [(shard,) + args for shard in shards])
+
+# Sum of the array results of task over all shards.
+def sumShards(task, shards, *args):
+    total = None
+    for partial in mapShards(task, shards, *args):
+        total = partial if total is None else total + partial
+    return total
+
+# Sorted object indices of a shard, as a slice if they are consecutive, for sequential reads of mapped columns.
+def shardObjects(shard):
+    (orderPath, start, end, firstWell, endWell) = shard
+    objects = np.sort(np.load(orderPath, mmap_mode='r')[start:end])
+    if objects[-1] - objects[0] + 1 == len(objects):
+        return slice(int(objects[0]), int(objects[-1]) + 1)
+    return objects
+
+# Shard task of 1D histograms of the given feature-major matrix rows, as a (row, cluster, bins) array.
+def featureHistogramsTask(args):
+    (shard, matrixPath, rows, labelPath, clusters, bins) = args
+    objects = shardObjects(shard)
+    matrix = np.load(matrixPath, mmap_mode='r')
+    labels = np.load(labelPath, mmap_mode='r')[objects]
+    return np.array([histograms.featureHistogram(matrix[row][objects], labels, clusters, bins) for row in rows])
+
+# Shard task of 2D histograms of pairs of the given feature-major matrix rows, as a (pair, cluster, bins, bins) array.
+def pairHistogramsTask(args):
+    (shard, matrixPath, rows, labelPath, pairs, clusters, bins) = args
+    objects = shardObjects(shard)
+    matrix = np.load(matrixPath, mmap_mode='r')
+    labels = np.load(labelPath, mmap_mode='r')[objects]
+    return histograms.pairHistograms([matrix[row][objects] for row in rows], labels, pairs, clusters, bins)
+
+# Shard task of object counts per well and cluster, as the first well of the shard and a (well, cluster) array.
+def wellHistogramTask(args):
+    (shard, wellIdsPath, labelPath, clusters) = args
+    (orderPath, start, end, firstWell, endWell) = shard
+    objects = shardObjects(shard)
+    wellIds = np.load(wellIdsPath, mmap_mode='r')[objects] - firstWell
+    labels = np.load(labelPath, mmap_mode='r')[objects]
+    return firstWell, histograms.wellHistogram(wellIds, labels, endWell - firstWell, clusters)
@@ -0,0 +1,23 @@
+import tangelo
+tangelo.paths(".")
+import compute
+import cache
+import resource
+
+# Resident set size of the server process in bytes, or its peak if the current size is not available.
+def residentBytes():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Runtime statistics of caches, compute timings, and memory.
+def run():
+    return {'caches': cache.cache_stats(),
+            'memory': {'budget': cache.memory_budget(),
+                       'held': cache.memory_held(),
+                       'resident': residentBytes()}}
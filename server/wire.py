@@ -0,0 +1,81 @@
+import json
+import struct
+import numpy as np
+import pandas as pd
+
+# Binary wire format, as an opt-in alternative to JSON for large numeric results.
+#
+# Layout: magic 'SCRN', uint8 version, 3 pad bytes, uint32 header length, ASCII JSON header, and then the raw
+# little-endian array data. The header holds the result structure, in which every array has been replaced by
+# {"$array": i}, and the dtype, shape, and data offset of array i. The header and arrays are aligned to 8 bytes.
+# Data frames are sent as {"columns": [...], "index": array, "values": [array or list per column]}.
+
+magic = 'SCRN'
+version = 1
+alignment = 8
+contentType = 'application/octet-stream'
+
+# Array types that can be decoded by the client, and conversions of other types to them.
+wireTypes = ['int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'float32', 'float64']
+wireConversions = {'bool': 'uint8', 'int64': 'float64', 'uint64': 'float64'}
+
+# Encoding input conversion.
+def encoding(value):
+    return str(value).replace('"', "")
+
+def isBinary(encoding):
+    return encoding == 'binary'
+
+def padding(length):
+    return -length % alignment
+
+# Columnar representation of a data frame; numeric columns as arrays and other columns as lists.
+def frame(dataFrame, dtype=np.float64):
+    values = []
+    for column in dataFrame.columns:
+        vector = dataFrame[column]
+        if vector.dtype.kind in 'biuf':
+            values.append(vector.values.astype(dtype))
+        else:
+            values.append([None if pd.isnull(value) else value for value in vector.tolist()])
+
+    return {'columns': [str(column) for column in dataFrame.columns],
+            'index': np.asarray(dataFrame.index.values, dtype=np.float64),
+            'values': values}
+
+# Encode a structure of dictionaries, lists, scalars, and arrays.
+def encode(value):
+    arrays = []
+
+    def extract(item):
+        if isinstance(item, np.ndarray):
+            arrays.append(item)
+            return {'$array': len(arrays) - 1}
+        elif isinstance(item, dict):
+            return {str(key): extract(element) for key, element in item.iteritems()}
+        elif isinstance(item, (list, tuple)):
+            return [extract(element) for element in item]
+        elif isinstance(item, np.generic):
+            return np.asscalar(item)
+        else:
+            return item
+
+    structure = extract(value)
+
+    # Convert arrays to little-endian wire types and lay them out.
+    specs = []
+    blocks = []
+    offset = 0
+    for array in arrays:
+        typeName = wireConversions.get(array.dtype.name, array.dtype.name)
+        assert typeName in wireTypes, "Array type %s has no wire type" % array.dtype.name
+        array = np.ascontiguousarray(array, dtype=np.dtype(typeName).newbyteorder('<'))
+        specs.append({'dtype': typeName, 'shape': list(array.shape), 'offset': offset})
+        block = array.tostring()
+        blocks.append(block + '\0' * padding(len(block)))
+        offset += len(blocks[-1])
+
+    header = json.dumps({'value': structure, 'arrays': specs})
+    header += ' ' * padding(len(magic) + 8 + len(header))
+
+    return ''.join([magic, struct.pack('<BxxxI', version, len(header)), header] + blocks)
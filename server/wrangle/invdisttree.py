@@ -13,6 +13,7 @@ class Invdisttree:
     """ inverse-distance-weighted interpolation using KDTree:
 invdisttree = Invdisttree( X, z )  -- data points, values
 interpol = invdisttree( q, nnear=3, eps=0, p=1, weights=None, stat=0 )
+interpol = invdisttree.interpolate( q, nnear=3, eps=0, p=1, weights=None, out=None )
     interpolates z from the 3 points nearest each query point q;
     For example, interpol[ a query point q ]
     finds the 3 data points nearest q, at distances d1 d2 d3
@@ -26,6 +27,11 @@ interpol = invdisttree( q, nnear=3, eps=0, p=1, weights=None, stat=0 )
     p: use 1 / distance**p
     weights: optional multipliers for 1 / distance**p, of the same shape as q
     stat: accumulate wsum, wn for average weights
+    out: interpolate() only, optional array of shape (len(q),) + z[0].shape to fill
+
+interpolate() is the batch form of invdisttree( q ): it weights all query
+points at once with array operations, and keeps no state, so that one tree
+can serve several batches concurrently. stat is not accumulated.
 
 How many nearest neighbors should one take ?
 a) start with 8 11 14 .. 28 in 2d 3d 4d .. 10d; see Wendel's formula
@@ -99,6 +105,28 @@ is exceedingly sensitive to distance and to h.
             jinterpol += 1
         return interpol if qdim > 1  else interpol[0]
 
+    def interpolate( self, q, nnear=6, eps=0, p=1, weights=None, out=None ):
+        q = np.asarray(q)
+        qdim = q.ndim
+        if qdim == 1:
+            q = np.array([q])
+        z = np.asarray(self.z)
+        if out is None:
+            out = np.empty( (len(q),) + z.shape[1:], dtype=np.result_type( z.dtype, np.float32 ))
+
+        distances, ix = self.tree.query( q, k=nnear, eps=eps )
+        if nnear == 1:
+            out[:] = z[ix]
+        else:  # weight z s by 1/dist, or take z of an exact hit --
+            w = 1 / np.maximum( distances, 1e-10 )**p
+            if weights is not None:
+                w *= weights[ix]  # >= 0
+            w /= np.sum( w, axis=1 )[:, np.newaxis]
+            out[:] = np.einsum( 'ij,ij...->i...', w, z[ix] )
+            exact = distances[:, 0] < 1e-10
+            out[exact] = z[ix[exact, 0]]
+        return out if qdim > 1  else out[0]
+
 #...............................................................................
 if __name__ == "__main__":
     import sys
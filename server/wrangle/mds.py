@@ -6,6 +6,7 @@ from matplotlib.colors import LogNorm
 import matplotlib.pyplot as plt
 from sklearn.manifold import TSNE
 import math
+from multiprocessing import Pool
 
 sampleSize = 100000
 dataPath = "data/"
@@ -14,23 +15,37 @@ projectionFile = dataPath + "mds_sample_projection.npy"
 mds0File = dataPath + "mds0.npy"
 mds1File = dataPath + "mds1.npy"
 
-def featureColumns(dataSet):
-    def column(colName):
-        col = data.numpyDump(dataSet, colName).astype(np.float64)
-        return (col - np.mean(col)) / np.std(col)
-
-    return np.array([column(col) for col in data.imageFeatures(dataSet)])
-
-    #                  [
-    #     'Tt.asm', 'TI1', 'Tt.den', 'Tt.sav', 'At.sav', 'At.den',
-    #     'Nt.den', 'Nz.0303', 'ext', 'Tz.0301', 'Tz.0404', 'ecc'
-    # ]])
+chunkSize = 2**18       # Number of objects to project at a time.
+nearest = 6             # Number of nearest sample objects to interpolate from.
+
+# Mean and standard deviation of every image feature, in chunked passes.
+def featureStatistics(dataSet):
+    statistics = []
+    for ftr in data.imageFeatures(dataSet):
+        col = data.numpyDump(dataSet, ftr)
+        total = sum(np.sum(col[start:start + chunkSize], dtype=np.float64) for start in range(0, len(col), chunkSize))
+        mean = total / len(col)
+        deviation = sum(np.sum(np.square(col[start:start + chunkSize] - mean), dtype=np.float64)
+                        for start in range(0, len(col), chunkSize))
+        statistics.append((mean, np.sqrt(deviation / len(col))))
+    return np.array(statistics, dtype=np.float64)
+
+# Standardized image feature rows of the given objects (a slice or sorted indices), as float32.
+def featureRows(dataSet, statistics, objects):
+    features = data.imageFeatures(dataSet)
+    rows = None
+    for i, ftr in enumerate(features):
+        values = (data.numpyDump(dataSet, ftr)[objects] - statistics[i, 0]) / statistics[i, 1]
+        if rows is None:
+            rows = np.empty((len(values), len(features)), dtype=np.float32)
+        rows[:, i] = values
+    return rows
 
 def mds(dataSet):
-    # Load all feature columns.
-    rows = featureColumns(dataSet).transpose()
-
-    sampledRows = rows[np.random.randint(len(rows), size=sampleSize)]
+    # Load a sample of standardized feature rows.
+    objectCount = len(data.numpyDump(dataSet, data.imageFeatures(dataSet)[0]))
+    sample = np.sort(np.random.randint(objectCount, size=sampleSize))
+    sampledRows = featureRows(dataSet, featureStatistics(dataSet), sample).astype(np.float64)
 
     print sampledRows
 
@@ -45,17 +60,39 @@ def mds(dataSet):
     np.save(valuesFile, sampledRows)
     np.save(projectionFile, projection)
 
-def extrapolateOtherCoordinates(dataSet):
-    values = np.load(valuesFile)
-    projection = np.load(projectionFile)
+# Inverse distance weighted interpolation of the sample projection, per process.
+projector = {}
+
+def loadProjector():
+    projector['tree'] = Invdisttree(np.load(valuesFile).astype(np.float32), np.load(projectionFile).astype(np.float32))
+    projector['coordinates'] = np.empty((chunkSize, 2), dtype=np.float32)
 
-    rows = featureColumns(dataSet).transpose()
+# Project a chunk of objects and write it to the MDS columns.
+def projectChunk(args):
+    (dataSet, statistics, start, end) = args
+    rows = featureRows(dataSet, statistics, slice(start, end))
+    coordinates = projector['tree'].interpolate(rows, nnear=nearest, out=projector['coordinates'][:end - start])
 
-    invDist = Invdisttree(values, projection)
-    inferCols = invDist(rows).transpose()
+    for i, mdsFile in enumerate([mds0File, mds1File]):
+        column = np.load(mdsFile, mmap_mode='r+')
+        column[start:end] = coordinates[:, i]
+        column.flush()
+    return end - start
 
-    np.save(mds0File, inferCols[0])
-    np.save(mds1File, inferCols[1])
+def extrapolateOtherCoordinates(dataSet):
+    statistics = featureStatistics(dataSet)
+    objectCount = len(data.numpyDump(dataSet, data.imageFeatures(dataSet)[0]))
+    for mdsFile in [mds0File, mds1File]:
+        np.lib.format.open_memmap(mdsFile, mode='w+', dtype=np.float32, shape=(objectCount,))
+
+    pool = Pool(initializer=loadProjector)
+    projected = 0
+    for count in pool.imap_unordered(projectChunk, [(dataSet, statistics, start, min(start + chunkSize, objectCount))
+                                                    for start in range(0, objectCount, chunkSize)]):
+        projected += count
+        print "Projected " + str(projected) + " of " + str(objectCount)
+    pool.close()
+    pool.join()
 
 def verify(sub):
     subMDS = np.load(projectionFile).transpose() if sub else [np.load(mds0File), np.load(mds1File)]
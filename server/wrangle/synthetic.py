@@ -0,0 +1,147 @@
+import os
+import csv
+import argparse
+import numpy as np
+
+# Synthetic screen generator. Writes a data set directory in the layout of numpyData: plate, column, row, x, and y
+# columns, image feature columns, and optional MDS columns under columns/, a config.py, and a wells.tab with well
+# type and target annotations. Every well is a mixture of a few phenotypes that shift the feature distributions.
+# Columns are filled in chunks of wells through memory maps, so that large screens are generated in bounded memory.
+
+chunkSize = 2**19       # Number of objects to generate at a time.
+phenotypes = ['Normal', 'Condensed', 'Protruded', 'Big cells']
+imageDimensions = [1344, 1024]
+
+def columnTag(index):
+    tag = ''
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        tag = chr(ord('A') + remainder) + tag
+    return tag
+
+def featureName(index):
+    return 'ftr%03d' % index
+
+configTemplate = '''# Synthetic screen of %(plates)d plates of %(columns)d by %(rows)d wells, generated by wrangle/synthetic.py.
+
+plates = %(plateLabels)r
+columns = %(columnLabels)r
+rows = %(rowLabels)r
+imageDimensions = %(imageDimensions)r
+
+# Share of objects to sample for training on well type annotations.
+wellTypeSample = 0.01
+
+# Objects with a lower classification confidence are marked as unsure.
+classifierConfidenceThreshold = 0.3
+
+def wellURL(plate, column, row):
+    wellTag = plates[plate] + columns[column] + rows[row]
+    return "dataset/images/" + plates[plate] + "/" + wellTag + "/" + wellTag + "_rgb.jpeg"
+
+wellImages = {'rgb': wellURL}
+'''
+
+# Write a synthetic screen to the given data set directory.
+def generate(path, plates, columns, rows, objectsPerWell, features, mds=True, seed=0):
+    random = np.random.RandomState(seed)
+    columnPath = os.path.join(path, 'columns')
+    if not os.path.isdir(columnPath):
+        os.makedirs(columnPath)
+
+    # Object count per well, and the phenotype mixture of every well.
+    wells = plates * columns * rows
+    counts = random.poisson(objectsPerWell, size=wells)
+    mixtures = random.dirichlet(np.ones(len(phenotypes)) * 0.5, size=wells)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    objectCount = int(offsets[-1])
+    print "Generate " + str(objectCount) + " objects in " + path
+
+    # Feature means and scales per phenotype.
+    means = random.normal(0, 1, size=(len(phenotypes), features)).astype(np.float32)
+    scales = random.uniform(0.5, 1.5, size=(len(phenotypes), features)).astype(np.float32)
+    logNormal = random.rand(features) < 0.3
+    projection = random.normal(0, 1, size=(features, 2)).astype(np.float32) / np.sqrt(features)
+
+    def column(name, dtype):
+        return np.lib.format.open_memmap(os.path.join(columnPath, name + '.npy'), mode='w+', dtype=dtype,
+                                         shape=(objectCount,))
+
+    plateColumn = column('plate', np.int32)
+    columnColumn = column('column', np.int32)
+    rowColumn = column('row', np.int32)
+    xColumn = column('x', np.float32)
+    yColumn = column('y', np.float32)
+    featureColumns = [column(featureName(f), np.float32) for f in range(features)]
+    mdsColumns = [column('mds0', np.float32), column('mds1', np.float32)] if mds else []
+
+    wellsPerPlate = columns * rows
+    first = 0
+    while first < wells:
+        # Chunk of whole wells, of at most chunkSize objects unless a single well is larger.
+        last = min(max(np.searchsorted(offsets, offsets[first] + chunkSize, side='right') - 1, first + 1), wells)
+        chunkWells = np.arange(first, last)
+        start, end = offsets[first], offsets[last]
+        wellOfObject = np.repeat(chunkWells, counts[chunkWells])
+
+        plateColumn[start:end] = wellOfObject // wellsPerPlate
+        columnColumn[start:end] = (wellOfObject // rows) % columns
+        rowColumn[start:end] = wellOfObject % rows
+        xColumn[start:end] = random.uniform(0, imageDimensions[0], size=end - start)
+        yColumn[start:end] = random.uniform(0, imageDimensions[1], size=end - start)
+
+        # Draw a phenotype per object from the mixture of its well.
+        cumulative = np.cumsum(mixtures[wellOfObject], axis=1)
+        phenotype = (random.rand(end - start, 1) > cumulative).sum(axis=1).clip(0, len(phenotypes) - 1)
+
+        values = means[phenotype] + scales[phenotype] * random.standard_normal((end - start, features)).astype(np.float32)
+        for f in range(features):
+            featureColumns[f][start:end] = np.exp(values[:, f]) if logNormal[f] else values[:, f]
+        for m, mdsColumn in enumerate(mdsColumns):
+            mdsColumn[start:end] = values.dot(projection[:, m])
+
+        first = last
+
+    for array in [plateColumn, columnColumn, rowColumn, xColumn, yColumn] + featureColumns + mdsColumns:
+        array.flush()
+
+    # Configuration.
+    with open(os.path.join(path, 'config.py'), 'w') as configFile:
+        configFile.write(configTemplate % {
+            'plates': plates, 'columns': columns, 'rows': rows,
+            'plateLabels': ['P' + str(p + 1).zfill(2) for p in range(plates)],
+            'columnLabels': [columnTag(c) for c in range(columns)],
+            'rowLabels': [str(r + 1).zfill(2) for r in range(rows)],
+            'imageDimensions': imageDimensions})
+
+    # Well annotations, with the dominant phenotype of every well as its target.
+    with open(os.path.join(path, 'wells.tab'), 'w') as wellFile:
+        writer = csv.DictWriter(wellFile, fieldnames=['plate', 'column', 'row', 'Type', 'Target'], delimiter='\t')
+        writer.writeheader()
+        for well in range(wells):
+            dominant = np.argmax(mixtures[well])
+            writer.writerow({
+                'plate': well // wellsPerPlate,
+                'column': (well // rows) % columns,
+                'row': well % rows,
+                'Type': 'Negative' if dominant == 0 else 'Positive',
+                'Target': phenotypes[dominant]
+            })
+
+    return objectCount
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic screen data set.")
+    parser.add_argument('path', help="data set directory, e.g. ../../dataset/Synthetic")
+    parser.add_argument('--plates', type=int, default=4)
+    parser.add_argument('--columns', type=int, default=24)
+    parser.add_argument('--rows', type=int, default=16)
+    parser.add_argument('--objects', type=int, default=100, help="mean number of objects per well")
+    parser.add_argument('--features', type=int, default=20)
+    parser.add_argument('--no-mds', dest='mds', action='store_false', help="omit the mds0 and mds1 columns")
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args()
+
+    generate(arguments.path, arguments.plates, arguments.columns, arguments.rows, arguments.objects,
+             arguments.features, arguments.mds, arguments.seed)
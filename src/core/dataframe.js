@@ -145,5 +145,19 @@ define(["require", "exports", './collection', './math'], function (require, expo
         return NumberFrame;
     }(DataFrame));
     exports.NumberFrame = NumberFrame;
+    // Column to row to value dictionary of a columnar frame from the binary wire format, with NaN as null.
+    function columnarDictionary(frame) {
+        if (frame === void 0) { frame = {}; }
+        var dictionary = {};
+        var rows = _.map(frame.index || [], function (r) { return r.toString(); });
+        (frame.columns || []).forEach(function (c, i) {
+            var values = frame.values[i];
+            var column = {};
+            rows.forEach(function (r, j) { return column[r] = values[j] === values[j] ? values[j] : null; });
+            dictionary[c] = column;
+        });
+        return dictionary;
+    }
+    exports.columnarDictionary = columnarDictionary;
 });
 //# sourceMappingURL=dataframe.js.map
\ No newline at end of file
@@ -168,4 +168,17 @@ export class NumberFrame extends DataFrame<number> {
     zeroNormalizedColumnVector(name: string) {
         return this.zeroNormalizedMatrix[this.columnIndex[name]];
     }
+}
+
+// Column to row to value dictionary of a columnar frame from the binary wire format, with NaN as null.
+export function columnarDictionary(frame: any = {}) {
+    var dictionary = {};
+    var rows = _.map(frame.index || [], r => r.toString());
+    (frame.columns || []).forEach((c, i) => {
+        var values = frame.values[i];
+        var column = {};
+        rows.forEach((r, j) => column[r] = values[j] === values[j] ? values[j] : null);
+        dictionary[c] = column;
+    });
+    return dictionary;
 }
\ No newline at end of file
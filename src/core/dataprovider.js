@@ -96,14 +96,22 @@ define(["require", "exports", 'jquery', 'lodash', 'bacon'], function (require, e
                 // Convert complex arguments to json.
                 var flatArgs = {};
                 _.pairs(proxyValue.args).forEach(function (p) { return flatArgs[p[0]] = JSON.stringify(p[1]); });
-                // Send request for information to server.
-                Promise
-                    .resolve($.ajax({
-                    type: "POST",
-                    url: this.url + "/" + proxyValue.name,
-                    data: flatArgs,
-                    dataType: "json"
-                }))
+                // Send request for information to server, in binary wire format if opted in.
+                var url = this.url + "/" + proxyValue.name;
+                var response;
+                if (proxyValue.binary) {
+                    flatArgs['encoding'] = JSON.stringify("binary");
+                    response = requestBinary(url, flatArgs).then(decodeBinary);
+                }
+                else {
+                    response = Promise.resolve($.ajax({
+                        type: "POST",
+                        url: url,
+                        data: flatArgs,
+                        dataType: "json"
+                    }));
+                }
+                response
                     .then(function (v) {
                     proxyValue.value = proxyValue.map(v);
                     proxyValue.converged = true;
@@ -124,13 +132,15 @@ define(["require", "exports", 'jquery', 'lodash', 'bacon'], function (require, e
     }());
     exports.ProxyService = ProxyService;
     var ProxyValue = (function () {
-        function ProxyValue(name, args, initialValue, map) {
+        function ProxyValue(name, args, initialValue, map, binary) {
             if (initialValue === void 0) { initialValue = null; }
             if (map === void 0) { map = function (v) { return v; }; }
+            if (binary === void 0) { binary = false; }
             this.name = name;
             this.args = args;
             this.initialValue = initialValue;
             this.map = map;
+            this.binary = binary;
             this.value = initialValue;
             this.converged = false;
         }
@@ -140,5 +150,76 @@ define(["require", "exports", 'jquery', 'lodash', 'bacon'], function (require, e
         return ProxyValue;
     }());
     exports.ProxyValue = ProxyValue;
+    // POST a request and resolve to the raw response bytes.
+    function requestBinary(url, args) {
+        return new Promise(function (resolve, reject) {
+            var request = new XMLHttpRequest();
+            request.open("POST", url);
+            request.responseType = "arraybuffer";
+            request.setRequestHeader("Content-Type", "application/x-www-form-urlencoded; charset=UTF-8");
+            request.onload = function () { return request.status === 200 ? resolve(request.response) : reject(request.statusText); };
+            request.onerror = function () { return reject(request.statusText); };
+            request.send($.param(args));
+        });
+    }
+    // Typed array constructors of wire format types.
+    var wireTypes = {
+        int8: Int8Array,
+        uint8: Uint8Array,
+        int16: Int16Array,
+        uint16: Uint16Array,
+        int32: Int32Array,
+        uint32: Uint32Array,
+        float32: Float32Array,
+        float64: Float64Array
+    };
+    // Decode a binary wire format response (see server/wire.py), where 1D arrays become typed arrays
+    // and higher dimensional arrays become nested arrays of typed array rows, without copying.
+    function decodeBinary(buffer) {
+        var view = new DataView(buffer);
+        var magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+        if (magic !== "SCRN" || view.getUint8(4) !== 1)
+            throw new Error("Unsupported wire format");
+        // ASCII JSON header, followed by array data.
+        var headerLength = view.getUint32(8, true);
+        var headerBytes = new Uint8Array(buffer, 12, headerLength);
+        var headerText = "";
+        for (var i = 0; i < headerLength; i += 8192) {
+            headerText += String.fromCharCode.apply(null, headerBytes.subarray(i, i + 8192));
+        }
+        var header = JSON.parse(headerText);
+        var dataOffset = 12 + headerLength;
+        var arrays = header.arrays.map(function (spec) {
+            var length = spec.shape.reduce(function (a, b) { return a * b; }, 1);
+            return nest(new wireTypes[spec.dtype](buffer, dataOffset + spec.offset, length), spec.shape);
+        });
+        // Substitute array placeholders.
+        var substitute = function (item) {
+            if (_.isArray(item))
+                return item.map(substitute);
+            else if (item !== null && typeof item === "object") {
+                if ("$array" in item)
+                    return arrays[item["$array"]];
+                var result = {};
+                _.pairs(item).forEach(function (p) { return result[p[0]] = substitute(p[1]); });
+                return result;
+            }
+            else
+                return item;
+        };
+        return substitute(header.value);
+    }
+    exports.decodeBinary = decodeBinary;
+    // Split a flat typed array into nested rows by shape.
+    function nest(flat, shape) {
+        if (shape.length <= 1)
+            return flat;
+        var rowLength = shape.slice(1).reduce(function (a, b) { return a * b; }, 1);
+        var rows = [];
+        for (var i = 0; i < shape[0]; i++) {
+            rows.push(nest(flat.subarray(i * rowLength, (i + 1) * rowLength), shape.slice(1)));
+        }
+        return rows;
+    }
 });
 //# sourceMappingURL=dataprovider.js.map
\ No newline at end of file
@@ -85,11 +85,11 @@ define(["require", "exports", './core/math', './core/graphics/style', './core/co
             this.dataSetInfo = new dataprovider_1.ProxyValue("dataSetInfo", { dataSet: dataSet }, new DataSetInfo(), function (ds) { return new DataSetInfo(ds.plateLabels, ds.columnLabels, ds.rowLabels, ds.wellTypes, ds.imageDimensions); });
             this.wellAnnotations = new dataprovider_1.ProxyValue("wellAnnotations", { dataSet: dataSet }, new WellAnnotations(), function (wa) { return new WellAnnotations(wa); });
             this.features = new dataprovider_1.ProxyValue("features", { dataSet: dataSet }, []);
-            this.objectInfo = new dataprovider_1.ProxyValue("objectInfo", objectInfoDict, new dataframe_1.NumberFrame(), function (o) { return new dataframe_1.NumberFrame(o); });
-            this.objectHistograms = new dataprovider_1.ProxyValue("objectHistograms2D", objectHistogramDict, new HistogramMatrix(), function (m) { return new HistogramMatrix(m); });
+            this.objectInfo = new dataprovider_1.ProxyValue("objectInfo", objectInfoDict, new dataframe_1.NumberFrame(), function (o) { return new dataframe_1.NumberFrame(dataframe_1.columnarDictionary(o)); }, true);
+            this.objectHistograms = new dataprovider_1.ProxyValue("objectHistograms2D", objectHistogramDict, new HistogramMatrix(), function (m) { return new HistogramMatrix(m); }, true);
             this.wellClusterShares = new dataprovider_1.ProxyValue("wellClusterShares", populationDict, new WellClusterShares(), function (s) { return new WellClusterShares(s); });
-            this.featureHistograms = new dataprovider_1.ProxyValue("featureHistograms", histogramDict, new FeatureHistograms(), function (hs) { return new FeatureHistograms(hs); });
-            this.objectFeatureValues = new dataprovider_1.ProxyValue("objectFeatureValues", objectValuesDict, new dataframe_1.NumberFrame(), function (vs) { return new dataframe_1.NumberFrame(vs); });
+            this.featureHistograms = new dataprovider_1.ProxyValue("featureHistograms", histogramDict, new FeatureHistograms(), function (hs) { return new FeatureHistograms(hs); }, true);
+            this.objectFeatureValues = new dataprovider_1.ProxyValue("objectFeatureValues", objectValuesDict, new dataframe_1.NumberFrame(), function (vs) { return new dataframe_1.NumberFrame(dataframe_1.columnarDictionary(vs)); }, true);
         }
         // Update state on server-based value update.
         EnrichedState.prototype.update = function () {
@@ -714,7 +714,9 @@ define(["require", "exports", './core/math', './core/graphics/style', './core/co
             var _this = this;
             if (dict === void 0) { dict = {}; }
             this.histograms = {};
-            _.keys(dict).map(function (k) { return _this.histograms[k] = new dataframe_1.DataFrame(dict[k]).normalize(false, true); });
+            // Bin counts arrive as typed arrays per feature.
+            _.keys(dict).map(function (k) { return _this.histograms[k] =
+                new dataframe_1.DataFrame(_.mapValues(dict[k], function (bins) { return Array.prototype.slice.call(bins); })).normalize(false, true); });
         }
         return FeatureHistograms;
     }());
@@ -804,8 +806,17 @@ define(["require", "exports", './core/math', './core/graphics/style', './core/co
             if (matrixMap === void 0) { matrixMap = {}; }
             this.matrices = matrixMap;
         }
+        // Histograms of a feature pair, where a pair that is only present in the opposite orientation is transposed.
         HistogramMatrix.prototype.matricesFor = function (xFeature, yFeature) {
-            return (this.matrices[xFeature] || {})[yFeature] || null;
+            var matrices = (this.matrices[xFeature] || {})[yFeature] || null;
+            var opposite = (this.matrices[yFeature] || {})[xFeature] || null;
+            if (!matrices && opposite) {
+                matrices = _.mapValues(opposite, function (m) { return math.Matrix.transpose(m); });
+                if (!this.matrices[xFeature])
+                    this.matrices[xFeature] = {};
+                this.matrices[xFeature][yFeature] = matrices;
+            }
+            return matrices;
         };
         return HistogramMatrix;
     }());
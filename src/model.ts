@@ -3,7 +3,7 @@ import bacon = require('bacon');
 import { Vector } from './core/math';
 import { Color } from './core/graphics/style';
 import { StringMap, Chain } from './core/collection';
-import { DataFrame, NumberFrame } from './core/dataframe';
+import { DataFrame, NumberFrame, columnarDictionary } from './core/dataframe';
 import { ProxyValue } from './core/dataprovider';
 import { BaseConfiguration } from './configuration';
 import { snapshot } from './core/collection';
@@ -140,12 +140,12 @@ export class EnrichedState extends InteractionState {
         this.objectInfo = new ProxyValue(
             "objectInfo",
             objectInfoDict,
-            new NumberFrame(), o => new NumberFrame(o)
+            new NumberFrame(), o => new NumberFrame(columnarDictionary(o)), true
         );
         this.objectHistograms = new ProxyValue(
             "objectHistograms2D",
             objectHistogramDict,
-            new HistogramMatrix(), m => new HistogramMatrix(m)
+            new HistogramMatrix(), m => new HistogramMatrix(m), true
         );
         this.wellClusterShares = new ProxyValue(
             "wellClusterShares",
@@ -155,12 +155,12 @@ export class EnrichedState extends InteractionState {
         this.featureHistograms = new ProxyValue(
             "featureHistograms",
             histogramDict,
-            new FeatureHistograms(), hs => new FeatureHistograms(hs)
+            new FeatureHistograms(), hs => new FeatureHistograms(hs), true
         );
         this.objectFeatureValues = new ProxyValue(
             "objectFeatureValues",
             objectValuesDict,
-            new NumberFrame(), vs => new NumberFrame(vs)
+            new NumberFrame(), vs => new NumberFrame(columnarDictionary(vs)), true
         );
     }
 
@@ -883,7 +883,9 @@ export class FeatureHistograms {
 
     constructor(dict: {} = {}) {
         this.histograms = {};
-        _.keys(dict).map(k => this.histograms[k] = new DataFrame(dict[k]).normalize(false, true));
+        // Bin counts arrive as typed arrays per feature.
+        _.keys(dict).map(k => this.histograms[k] =
+            new DataFrame(_.mapValues(dict[k], bins => Array.prototype.slice.call(bins))).normalize(false, true));
     }
 }
 
@@ -973,7 +975,17 @@ export class HistogramMatrix {
         this.matrices = <any>matrixMap;
     }
 
+    // Histograms of a feature pair, where a pair that is only present in the opposite orientation is transposed.
     matricesFor(xFeature: string, yFeature: string) {
-        return (this.matrices[xFeature] || {})[yFeature] || null;
+        var matrices = (this.matrices[xFeature] || {})[yFeature] || null;
+
+        var opposite = (this.matrices[yFeature] || {})[xFeature] || null;
+        if(!matrices && opposite) {
+            matrices = <any>_.mapValues(<any>opposite, m => math.Matrix.transpose(m));
+            if(!this.matrices[xFeature]) this.matrices[xFeature] = {};
+            this.matrices[xFeature][yFeature] = matrices;
+        }
+
+        return matrices;
     }
 }
\ No newline at end of file